@@ -1,13 +1,40 @@
-import dotenv from "dotenv";
-dotenv.config();
+// accepts a single point { lat, lon, token }
+// or a batch { points: [{ lat, lon, t }, ...], token }
+// every accepted point goes out to the Socket.IO clients as "coords"
+function forwardPoint(req, point){
+    req.app.get("io")?.emit("coords", { lat: point.lat, lon: point.lon, t: point.t });
+}
 
 export const recieveCoordinates = async (req, res) => {
     try{
-        const { lat, lon, token } = req.body;
+        const { lat, lon, token, points } = req.body;
+
+        if(Array.isArray(points)){
+            //every point needs both coordinates
+            const invalid = points.findIndex(p => p?.lat === undefined || p?.lon === undefined);
+            if(invalid !== -1){
+                return res.status(400).json({message: "Point is missing latitude or longitude", index: invalid});
+            }
+
+            //check if authenticated
+            if(token != process.env.TOKEN){
+                return res.status(403).json({message: "Permission denied"});
+            }
+
+            points.forEach(p => forwardPoint(req, p));
+
+            const latest = points[points.length - 1];
+            return res.status(200).json({
+                message: "Coordinates recieved",
+                received: points.length,
+                lat: latest?.lat,
+                lon: latest?.lon
+            })
+        }
 
         //lat check
         if(lat === undefined){
-            return res.status(400).json({message: "Latitude is not provided"});    
+            return res.status(400).json({message: "Latitude is not provided"});
         }
         //lon check
         if(lon === undefined){
@@ -19,6 +46,8 @@ export const recieveCoordinates = async (req, res) => {
             return res.status(403).json({message: "Permission denied"});
         }
 
+        forwardPoint(req, { lat, lon });
+
         return res.status(200).json({
             message: "Coordinates recieved",
             lat: lat,
@@ -27,4 +56,4 @@ export const recieveCoordinates = async (req, res) => {
     }catch(err){
         return res.status(500).json({ error: err.message });
     }
-}
\ No newline at end of file
+}
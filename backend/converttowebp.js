@@ -1,38 +1,306 @@
 import sharp from "sharp";
 import fs from "fs-extra";
 import path from "path";
+import os from "os";
+import crypto from "crypto";
+import { fileURLToPath } from "url";
+import { Worker, isMainThread, parentPort } from "worker_threads";
 
-const inputFolder = "./public/images/inventions/africa/senegal";      // folder with your original images
-const outputFolder = "./public/images/inventions/africa/senegal";// folder to save .webp files
+// Image pipeline: walks all of public/images, converts new or changed
+// images to .webp on one worker thread per core, and writes a manifest.
+// Every image also gets smaller copies in public/generated (one per width
+// in VARIANT_WIDTHS below its own width) and a blurred placeholder of a
+// few hundred bytes, inlined in the manifest as a data URL.
+//
+// Everything in public/generated has the first HASH_LENGTH hex digits of
+// its sha1 in the file name, so server.js can serve that folder as
+// immutable. The master images are not copied there: their hashed URL
+// (generated/images/a/b.<hash>.webp) is an alias server.js resolves to the
+// file in public/images, as long as that file still has the hash. The
+// manifest maps each logical "images/..." path to those URLs, and files in
+// public/generated that the new manifest doesn't list are deleted.
+//
+//   node converttowebp.js            convert what changed since the last run
+//   node converttowebp.js --force    convert everything again
+//
+// A source is skipped when its content hash matches the manifest and its
+// outputs are still there. Existing .webp files are the originals for most
+// images, they are only hashed and listed.
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+const publicFolder = path.join(__dirname, "public");
+const inputFolder = path.join(publicFolder, "images");
+const generatedFolder = path.join(publicFolder, "generated");
+const manifestPath = path.join(__dirname, "api", "image_manifest.json");
+const MANIFEST_VERSION = 3;
+const HASH_LENGTH = 10;
+
+const convertible = [".jpg", ".jpeg", ".png", ".gif", ".tiff", ".bmp", ".avif"];
+const WEBP_QUALITY = 100;
+
+// card and column sizes on the kiosk screens
+const VARIANT_WIDTHS = [320, 640, 1024];
+const VARIANT_QUALITY = 75;
+const PLACEHOLDER_WIDTH = 16;
+const PLACEHOLDER_QUALITY = 40;
+
+// "images/..." as used in countries.json / inventions.json
+function logicalPath(file) {
+  return path.relative(publicFolder, file).split(path.sep).join("/");
+}
+
+function sha1(data) {
+  return crypto.createHash("sha1").update(data).digest("hex");
+}
+
+// public/images/a/b.webp -> public/generated/images/a/b-640w.<hash>.webp
+function hashedFile(master, suffix, data) {
+  const file = path.join(generatedFolder, path.relative(publicFolder, master));
+  return file.replace(/\.webp$/i, `${suffix}.${sha1(data).slice(0, HASH_LENGTH)}.webp`);
+}
+
+// URL of a master image, served from public/images by server.js
+function hashedUrl(master, data) {
+  return logicalPath(hashedFile(master, "", data));
+}
+
+// same name means same bytes, so an existing file is never rewritten
+async function writeHashed(master, suffix, data) {
+  const file = hashedFile(master, suffix, data);
+  if (!(await fs.pathExists(file))) {
+    await fs.ensureDir(path.dirname(file));
+    await fs.writeFile(file, data);
+  }
+  return logicalPath(file);
+}
+
+/* -------------------------------------------------------------------------------------- */
+// worker: one image at a time, libvips itself kept to one thread
+// so the pool doesn't oversubscribe the cores
+async function processImage(job) {
+  if (job.source !== job.master) {
+    await fs.ensureDir(path.dirname(job.master));
+    await sharp(job.source)
+      .webp({ quality: WEBP_QUALITY })
+      .toFile(job.master);
+  }
+
+  const hashed = hashedUrl(job.master, await fs.readFile(job.master));
+
+  const meta = await sharp(job.master).metadata();
+  const variants = [];
+  for (const width of VARIANT_WIDTHS) {
+    if (width >= meta.width) break;
+    const { data, info } = await sharp(job.master)
+      .resize({ width })
+      .webp({ quality: VARIANT_QUALITY })
+      .toBuffer({ resolveWithObject: true });
+    const url = await writeHashed(job.master, `-${width}w`, data);
+    variants.push({ url, width: info.width, height: info.height, bytes: info.size });
+  }
+
+  const tiny = await sharp(job.master)
+    .resize({ width: PLACEHOLDER_WIDTH })
+    .blur()
+    .webp({ quality: PLACEHOLDER_QUALITY })
+    .toBuffer();
+
+  return {
+    hashed,
+    width: meta.width,
+    height: meta.height,
+    variants,
+    placeholder: `data:image/webp;base64,${tiny.toString("base64")}`,
+  };
+}
+
+if (!isMainThread) {
+  sharp.concurrency(1);
+  parentPort.on("message", async (job) => {
+    try {
+      parentPort.postMessage({ ok: true, result: await processImage(job) });
+    } catch (err) {
+      parentPort.postMessage({ ok: false, error: String(err) });
+    }
+  });
+}
+
+/* -------------------------------------------------------------------------------------- */
+// main thread
+async function hashFile(file) {
+  const data = await fs.readFile(file);
+  return {
+    sha1: sha1(data),
+    bytes: data.length,
+  };
+}
+
+async function listImages() {
+  const entries = await fs.readdir(inputFolder, { recursive: true });
+  return entries
+    .map((entry) => path.join(inputFolder, entry))
+    .filter((file) => {
+      const ext = path.extname(file).toLowerCase();
+      return ext === ".webp" || convertible.includes(ext);
+    })
+    .sort();
+}
+
+async function readManifest() {
+  try {
+    const manifest = await fs.readJson(manifestPath);
+    if (manifest.version === MANIFEST_VERSION) return manifest;
+  } catch {
+    // first run or unreadable, convert everything
+  }
+  return { version: MANIFEST_VERSION, images: {} };
+}
+
+async function outputsExist(entry) {
+  const files = (entry.variants || []).map((v) => v.url);
+  if (entry.webp) files.push(entry.webp);
+  for (const file of files) {
+    if (!(await fs.pathExists(path.join(publicFolder, file)))) return false;
+  }
+  return true;
+}
+
+// A worker that dies (uncaught error, crash in libvips, out of memory)
+// fails the image it was on and is replaced while jobs are left.
+function runPool(jobs, size) {
+  return new Promise((resolve) => {
+    const failed = [];
+    let next = 0;
+    let alive = 0;
+
+    if (jobs.length === 0) return resolve(failed);
+
+    const start = () => {
+      const worker = new Worker(__filename);
+      let job = null;
+      alive++;
+
+      const feed = () => {
+        if (next >= jobs.length) {
+          job = null;
+          worker.terminate();
+          return;
+        }
+        job = jobs[next++];
+        worker.postMessage(job);
+      };
+
+      worker.on("message", (result) => {
+        if (result.ok) {
+          Object.assign(job.entry, result.result);
+          console.log(`Converted: ${job.name}`);
+        } else {
+          console.error(`Error converting ${job.name}:`, result.error);
+          failed.push(job.name);
+        }
+        feed();
+      });
+      worker.on("error", (err) => {
+        console.error(`Worker failed${job ? ` on ${job.name}` : ""}:`, err);
+      });
+      // always follows "error"; also the only sign of a worker killed outright
+      worker.on("exit", (code) => {
+        alive--;
+        if (job) {
+          console.error(`Error converting ${job.name}: worker exited with code ${code}`);
+          failed.push(job.name);
+          job = null;
+        }
+        if (next < jobs.length) start();
+        else if (alive === 0) resolve(failed);
+      });
+
+      feed();
+    };
+
+    for (let i = 0; i < Math.min(size, jobs.length); i++) start();
+  });
+}
+
+// variants of replaced or deleted images, and master copies from before the
+// masters were served in place
+async function pruneGenerated(images) {
+  const keep = new Set();
+  for (const entry of Object.values(images)) {
+    for (const variant of entry.variants || []) keep.add(variant.url);
+  }
+  if (!(await fs.pathExists(generatedFolder))) return 0;
+  let pruned = 0;
+  const entries = await fs.readdir(generatedFolder, { recursive: true, withFileTypes: true });
+  for (const entry of entries) {
+    if (!entry.isFile()) continue;
+    const file = path.join(entry.parentPath ?? entry.path, entry.name);
+    if (!keep.has(logicalPath(file))) {
+      await fs.remove(file);
+      pruned++;
+    }
+  }
+  return pruned;
+}
 
 async function convertImages() {
-  await fs.ensureDir(outputFolder);
+  const started = Date.now();
+  const force = process.argv.includes("--force");
+  const previous = await readManifest();
+  const files = await listImages();
+  const fileSet = new Set(files);
 
-  const files = await fs.readdir(inputFolder);
+  const images = {};
+  const jobs = [];
+  let skipped = 0;
 
   for (const file of files) {
     const ext = path.extname(file).toLowerCase();
-    if (![".jpg", ".jpeg", ".png", ".gif", ".tiff", ".bmp", ".avif"].includes(ext)) {
-      console.log(`Skipping unsupported file: ${file}`);
-      continue;
-    }
+    const name = logicalPath(file);
+    let master = file;
 
-    const inputPath = path.join(inputFolder, file);
-    const outputName = path.basename(file, ext) + ".webp";
-    const outputPath = path.join(outputFolder, outputName);
+    if (ext === ".webp") {
+      // the output of a source listed below, not an original of its own
+      const stem = file.slice(0, -ext.length);
+      if (convertible.some((e) => fileSet.has(stem + e) || fileSet.has(stem + e.toUpperCase()))) continue;
+    } else {
+      master = file.slice(0, -ext.length) + ".webp";
+    }
 
-    try {
-      await sharp(inputPath)
-        .webp({ quality: 100 })
-        .toFile(outputPath);
+    const entry = await hashFile(file);
+    if (master !== file) entry.webp = logicalPath(master);
+    images[name] = entry;
 
-      console.log(`Converted: ${file} → ${outputName}`);
-    } catch (err) {
-      console.error(`Error converting ${file}:`, err);
+    const old = previous.images[name];
+    if (!force && old && old.sha1 === entry.sha1 && (await outputsExist(old))) {
+      images[name] = old;
+      skipped++;
+      continue;
     }
+    jobs.push({ name, source: file, master, entry });
   }
 
-  console.log("Done!");
+  const poolSize = os.availableParallelism ? os.availableParallelism() : os.cpus().length;
+  const failed = await runPool(jobs, poolSize);
+  // failed sources get converted again next run
+  for (const name of failed) delete images[name];
+
+  await fs.writeJson(manifestPath, {
+    version: MANIFEST_VERSION,
+    generated: new Date().toISOString(),
+    images,
+  });
+  const pruned = await pruneGenerated(images);
+
+  const seconds = ((Date.now() - started) / 1000).toFixed(1);
+  console.log(
+    `Done! ${jobs.length - failed.length} converted, ${skipped} unchanged, ` +
+    `${failed.length} failed, ${pruned} pruned, ${Object.keys(images).length} images in the manifest (${seconds}s)`
+  );
 }
 
-convertImages();
+if (isMainThread) {
+  convertImages();
+}
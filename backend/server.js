@@ -5,34 +5,122 @@ import path from "path";
 import { fileURLToPath } from "url";
 import fs from "fs";
 import os from "os";
+import crypto from "crypto";
+import { recieveCoordinates } from "./controllers/raspControllers.js";
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
+// TOKEN for the Pi's coordinate posts comes from .env when there is one
+try {
+    process.loadEnvFile();
+} catch {
+    // no .env, use the environment as it is
+}
+
 const app = express();
 const server = http.createServer(app);
 const io = new Server(server, {
     cors: { origin: "*", methods: ["GET","POST"] },
     transports: ["polling", "websocket"]
 });
+// for the controllers
+app.set("io", io);
 
 app.use(express.json());
+
+/* -------------------------------------------------------------------------------------- */
+// content-hashed image URLs from converttowebp.js, a changed image gets a new name
+const manifestPath = path.join(__dirname, "api", "image_manifest.json");
+const HASH_LENGTH = 10;
+const immutable = { immutable: true, maxAge: "1y" };
+
+let manifestCache = { mtimeMs: null, urls: new Map(), masters: new Map() };
+
+// urls: "images/..." path -> hashed URL, masters: hashed URL -> "images/..." path
+async function imageManifest() {
+    let stat;
+    try {
+        stat = await fs.promises.stat(manifestPath);
+    } catch {
+        return { urls: new Map(), masters: new Map() };
+    }
+    if (stat.mtimeMs !== manifestCache.mtimeMs) {
+        try {
+            const manifest = JSON.parse(await fs.promises.readFile(manifestPath, "utf8"));
+            const urls = new Map();
+            const masters = new Map();
+            for (const [name, entry] of Object.entries(manifest.images ?? {})) {
+                if (!entry.hashed) continue;
+                // converted sources are referenced by their .webp output
+                const master = entry.webp ?? name;
+                urls.set(master, entry.hashed);
+                masters.set(entry.hashed, master);
+            }
+            manifestCache = { mtimeMs: stat.mtimeMs, urls, masters };
+        } catch {
+            // caught mid-write, keep the last one
+        }
+    }
+    return manifestCache;
+}
+
+// copy of a countries/inventions entry with its image paths swapped for hashed URLs
+function rewriteImages(item, urls) {
+    if (urls.size === 0) return item;
+    const copy = { ...item };
+    if (item.images) {
+        copy.images = Object.fromEntries(
+            Object.entries(item.images).map(([kind, image]) => [kind, urls.get(image) ?? image])
+        );
+    }
+    if (item.inventions) {
+        copy.inventions = item.inventions.map((i) => (urls.has(i.image) ? { ...i, image: urls.get(i.image) } : i));
+    }
+    return copy;
+}
+
+// hashed URLs of master images aren't copies on disk, they name the file in
+// public/images; it is only served under that name while its bytes still match
+const verified = new Map(); // hashed URL -> "mtimeMs:size" the hash was checked at
+
+app.use("/generated", async (req, res, next) => {
+    if (req.method !== "GET" && req.method !== "HEAD") return next();
+    const url = `generated${req.path}`;
+    const master = (await imageManifest()).masters.get(url);
+    if (!master) return next();
+    const file = path.join(__dirname, "public", master);
+    try {
+        const stat = await fs.promises.stat(file);
+        const version = `${stat.mtimeMs}:${stat.size}`;
+        if (verified.get(url) !== version) {
+            const hash = crypto.createHash("sha1").update(await fs.promises.readFile(file)).digest("hex");
+            if (!url.endsWith(`.${hash.slice(0, HASH_LENGTH)}.webp`)) return next();
+            verified.set(url, version);
+        }
+    } catch {
+        return next();
+    }
+    res.sendFile(file, immutable);
+});
+app.use("/generated", express.static(path.join(__dirname, "public", "generated"), immutable));
 app.use(express.static(path.join(__dirname, "public")));
 
 // API routes
 // for "Invention"
 app.get("/api/inventions", (req, res) => {
     const dataPath = path.join(__dirname, "api", "inventions.json");
-    fs.readFile(dataPath, "utf8", (err, data) => {
+    fs.readFile(dataPath, "utf8", async (err, data) => {
         if (err) return res.status(500).json({ error: "Could not read 'inventions' data" });
-        res.json(JSON.parse(data));
+        const { urls } = await imageManifest();
+        res.json(JSON.parse(data).map((item) => rewriteImages(item, urls)));
     });
 });
 
 app.get("/api/inventions/:country", (req, res) => {
     const country = req.params.country.toLowerCase();
     const dataPath = path.join(__dirname, "api", "inventions.json");
-    fs.readFile(dataPath, "utf8", (err, data) => {
+    fs.readFile(dataPath, "utf8", async (err, data) => {
         if (err) return res.status(500).json({ error: "Could not read 'inventions' data" });
 
         const inventions = JSON.parse(data);
@@ -45,7 +133,7 @@ app.get("/api/inventions/:country", (req, res) => {
             });
         }
         
-        res.json(countryData);
+        res.json(rewriteImages(countryData, (await imageManifest()).urls));
     });
 });
 
@@ -53,16 +141,17 @@ app.get("/api/inventions/:country", (req, res) => {
 // for "About"
 app.get("/api/countries", (req, res) => {
     const dataPath = path.join(__dirname, "api", "countries.json");
-    fs.readFile(dataPath, "utf8", (err, data) => {
+    fs.readFile(dataPath, "utf8", async (err, data) => {
         if (err) return res.status(500).json({ error: "Could not read 'countries' data" });
-        res.json(JSON.parse(data));
+        const { urls } = await imageManifest();
+        res.json(JSON.parse(data).map((item) => rewriteImages(item, urls)));
     });
 });
 
 app.get("/api/countries/:country", (req, res) => {
     const country = req.params.country.toLowerCase();
     const dataPath = path.join(__dirname, "api", "countries.json");
-    fs.readFile(dataPath, "utf8", (err, data) => {
+    fs.readFile(dataPath, "utf8", async (err, data) => {
         if (err) return res.status(500).json({ error: "Could not read 'countries' data" });
 
         const inventions = JSON.parse(data);
@@ -76,11 +165,57 @@ app.get("/api/countries/:country", (req, res) => {
         }
 
 
-        res.json(countryData);
+        res.json(rewriteImages(countryData, (await imageManifest()).urls));
     });
 });
 
+// coordinates posted by the Pi (raspPi/send_coords.py), single or batched
+app.post("/api/coordinates", recieveCoordinates);
+
 /* -------------------------------------------------------------------------------------- */
+// stamp traced payloads (see raspPi/tracing.py) as they leave for the kiosk
+// the relay posts to Node-RED on this machine, so the clocks are the same,
+// and gets the stamped trace back for its hop histograms
+const RELAY_TRACE_URL = process.env.RELAY_TRACE_URL ?? "http://127.0.0.1:9100/traces";
+
+function stampTrace(data) {
+    const trace = data?.trace;
+    if (trace?.hops) {
+        trace.hops.socketio_emit = Date.now() / 1000;
+        fetch(RELAY_TRACE_URL, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(trace)
+        }).catch((err) => console.error("Could not report trace to the relay:", err.message));
+    }
+    return data;
+}
+
+// the relay sends the country's content along (see raspPi/content.py); its
+// preload lists go out ahead of newData, one per page, so each kiosk starts
+// on exactly the images it is about to render
+function emitPreload(data, urls) {
+    const pages = data?.content?.preload ?? {};
+    for (const [type, images] of Object.entries(pages)) {
+        io.emit("preload", {
+            type,
+            country: data.content.country,
+            // same URL the page gets in newData, see rewriteNewData
+            images: images.map((image) => ({ ...image, url: urls.get(image.path) ?? image.path }))
+        });
+    }
+}
+
+// page data from Node-RED with its image paths swapped for the hashed URLs,
+// like the /api routes, whichever way Node-RED got them
+function rewriteNewData(data, urls) {
+    if (urls.size === 0 || typeof data !== "object" || data === null) return data;
+    const copy = { ...data };
+    if (data.information?.images) copy.information = rewriteImages(data.information, urls);
+    if (data.invention?.image) copy.invention = rewriteImages({ inventions: [data.invention] }, urls).inventions[0];
+    return copy;
+}
+
 // Socket.IO
 io.on("connection", (socket) => {
     console.log("Client connected:", socket.id);
@@ -95,9 +230,12 @@ io.on("connection", (socket) => {
         io.emit("control", data); // send to all, including sender
     });
 
-    socket.on("newData", (data) => {
+    socket.on("newData", async (data) => {
+        const payload = data.payload ?? data;
+        const { urls } = await imageManifest();
+        emitPreload(payload, urls);
         // Emit to all clients without rooms
-        io.emit("newData", data.payload ?? data);
+        io.emit("newData", stampTrace(rewriteNewData(payload, urls)));
     });
 
     socket.on("loading", (data) => {
@@ -112,9 +250,12 @@ io.on("connection", (socket) => {
         io.emit("start", data.payload ?? data);
     });
 
-    socket.on("stableCoordinatesSent", (data) => {
+    socket.on("stableCoordinatesSent", async (data) => {
+        const payload = data.payload ?? data;
+        // the country is known now, long before the page data arrives
+        emitPreload(payload, (await imageManifest()).urls);
         // forward the stable coordinates
-        io.emit("stableCoordinatesSent", data.payload ?? data);
+        io.emit("stableCoordinatesSent", stampTrace(payload));
 
         // reset Start to false
         io.emit("start", { "start": false });
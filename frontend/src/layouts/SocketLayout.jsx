@@ -7,6 +7,7 @@ const SocketLayout = ({ namespace, title, children }) => {
 	const [data, setData] = useState(null);
 	const [loading, setLoading] = useState(true);
 	const socketRef = useRef(null);
+	const preloadRef = useRef([]);
 
 	// set page title
 	useEffect(() => {
@@ -55,9 +56,24 @@ const SocketLayout = ({ namespace, title, children }) => {
 			setLoading(false);
 		};
 
+		// start every image download while the spinner is still up;
+		// the <img> tags rendered later get them from the browser cache
+		const handlePreload = (incomingData) => {
+			const { type, images = [] } = normalize(incomingData);
+			// each page only fetches the images it renders
+			if (type !== namespace) return;
+			preloadRef.current = images.map((image) => {
+				const img = new Image();
+				img.fetchPriority = image.priority;
+				img.src = `${import.meta.env.VITE_SOCKET_URL}${image.url}`;
+				return img;
+			});
+		};
+
 		// listen for events
 		socket.on("newData", handleIncoming);
 		socket.on("loading", handleIncoming);
+		socket.on("preload", handlePreload);
 
 		socket.on("connect", () => {
 			console.log("Socket connected! ID:", socket.id);
@@ -78,6 +94,7 @@ const SocketLayout = ({ namespace, title, children }) => {
 		return () => {
 			socket.off("newData", handleIncoming);
 			socket.off("loading", handleIncoming);
+			socket.off("preload", handlePreload);
 			socket.disconnect();
 		};
 	}, [namespace]);
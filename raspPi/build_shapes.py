@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import urllib.request
+
+from geocoder import COUNTRIES_PATH, SHAPES_PATH, _feature_country, _geometry_polygons, load_exhibit_countries
+
+# ----------------------------
+# Build the geocoder's shape file
+# ----------------------------
+# Produces SHAPES_PATH from Natural Earth 1:50m "Admin 0 - Countries":
+# keeps only the exhibit countries from countries.json, thins every ring
+# with Douglas-Peucker and rounds the coordinates. The result is small
+# enough to commit and the same source always gives the same file.
+#
+#   python build_shapes.py                     download the pinned release
+#   python build_shapes.py --source ne.geojson use a local copy instead
+
+SOURCE_URL = ("https://raw.githubusercontent.com/nvkelso/natural-earth-vector/"
+              "v5.1.2/geojson/ne_50m_admin_0_countries.geojson")
+TOLERANCE = 0.02  # degrees, about 2 km; well under the dwell room
+PRECISION = 3     # decimals kept per coordinate
+
+
+def _segment_distance(p, a, b):
+    (x, y), (ax, ay), (bx, by) = p, a, b
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return ((x - ax) ** 2 + (y - ay) ** 2) ** 0.5
+    t = max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / (dx * dx + dy * dy)))
+    return ((x - ax - t * dx) ** 2 + (y - ay - t * dy) ** 2) ** 0.5
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker, iterative so long coastlines don't hit the recursion limit."""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, worst_at = 0.0, None
+        for i in range(first + 1, last):
+            d = _segment_distance(points[i], points[first], points[last])
+            if d > worst:
+                worst, worst_at = d, i
+        if worst_at is not None and worst > tolerance:
+            keep[worst_at] = True
+            stack.append((first, worst_at))
+            stack.append((worst_at, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_ring(ring, tolerance, precision):
+    """None when the ring collapses below a triangle."""
+    # a closed ring starts and ends on the same point, split it in two halves
+    # so the endpoints Douglas-Peucker pins are not one and the same
+    mid = len(ring) // 2
+    points = simplify(ring[:mid + 1], tolerance)[:-1] + simplify(ring[mid:], tolerance)
+    points = [[round(x, precision), round(y, precision)] for x, y, *_ in points]
+    deduped = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+    return deduped if len(deduped) >= 4 else None
+
+
+def build(source, countries_path=COUNTRIES_PATH, tolerance=TOLERANCE, precision=PRECISION):
+    countries = load_exhibit_countries(countries_path)
+    lookup = {name.casefold(): i for i, name in enumerate(countries)}
+    features = []
+    for feature in source.get("features", []):
+        country_id = _feature_country(feature.get("properties") or {}, lookup)
+        if country_id is None:
+            continue
+        polygons = []
+        for rings in _geometry_polygons(feature.get("geometry")):
+            outline = simplify_ring(rings[0], tolerance, precision)
+            if outline is None:
+                continue  # islands smaller than the tolerance
+            holes = [h for h in (simplify_ring(r, tolerance, precision) for r in rings[1:]) if h]
+            polygons.append([outline] + holes)
+        if polygons:
+            features.append({
+                "type": "Feature",
+                "properties": {"ADMIN": countries[country_id]},
+                "geometry": {"type": "MultiPolygon", "coordinates": polygons},
+            })
+    features.sort(key=lambda f: f["properties"]["ADMIN"])
+    return {"type": "FeatureCollection", "features": features}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the simplified country shapes for geocoder.py")
+    parser.add_argument("--source", help="local Natural Earth admin-0 GeoJSON instead of downloading it")
+    parser.add_argument("--out", default=SHAPES_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    if args.source:
+        with open(args.source, encoding="utf-8") as f:
+            source = json.load(f)
+    else:
+        print(f"Downloading {SOURCE_URL}")
+        with urllib.request.urlopen(SOURCE_URL, timeout=60) as response:
+            source = json.load(response)
+
+    shapes = build(source, tolerance=args.tolerance)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(shapes, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"Wrote {len(shapes['features'])} countries to {args.out} ({os.path.getsize(args.out) // 1024} KiB)")
+
+    covered = {f["properties"]["ADMIN"] for f in shapes["features"]}
+    missing = [name for name in load_exhibit_countries() if name not in covered]
+    if missing:
+        print("No outline for:", ", ".join(missing))
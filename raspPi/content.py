@@ -0,0 +1,365 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import struct
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # gzip only
+
+import quizbank
+from geocoder import API_DIR, COUNTRIES_PATH
+
+# ----------------------------
+# Country content store
+# ----------------------------
+# countries.json and inventions.json loaded once, indexed by case-folded
+# country name, and reloaded when either file changes on disk.
+#
+# bundle(country) is everything a kiosk page needs for one country, in one
+# document:
+#   {"country": ..., "version": ..., "about": <countries.json entry>,
+#    "inventions": <inventions.json entry>, "quiz": [questions],
+#    "images": [{"url", "path", "kind", "bytes", "width", "height",
+#                "variants", "placeholder"}],
+#    "preload": {page: [{"url", "path", "bytes", "priority"}]}}
+# Bundles are built for every country on load, with the image sizes read
+# from backend/public, and kept until the data changes. Smaller copies of
+# each image and its blurred placeholder come from the manifest written by
+# backend/converttowebp.js; without it "variants" is empty.
+#
+# The manifest also has a content-hashed URL for every image (served as
+# immutable by server.js). When it does, every image path in the served
+# documents is swapped for that URL; "path" in a bundle keeps the original.
+#
+# "preload" lists, per kiosk page ("about", "invention"), the images that
+# page will ask for, the ones at the top of the page first, so they can all
+# be requested while the spinner is up (see server.js and SocketLayout).
+# The quiz page has no images and no list. Quiz questions come
+# from the compiled bank (see quizbank.py), or are compiled on load when the
+# bank is missing or out of date.
+#
+# The /api responses (see content_server.py) are serialised once per load,
+# each with its ETag, so answering a request is a dict lookup. Bodies of
+# COMPRESS_MIN_SIZE bytes or more are also compressed once per load, with
+# brotli when the module is installed and with gzip always.
+
+INVENTIONS_PATH = os.path.join(API_DIR, "inventions.json")
+PUBLIC_DIR = os.path.join(API_DIR, "..", "public")
+IMAGE_MANIFEST_PATH = os.path.join(API_DIR, "image_manifest.json")
+
+# image kinds each kiosk page renders (SocketLayout namespace -> kinds)
+PAGE_IMAGES = {
+    "about": ("flag", "map", "food", "place"),
+    "invention": ("invention",),
+}
+# shown at the top of their page, fetched before the rest
+CRITICAL_IMAGES = ("flag", "map", "invention")
+
+COMPRESS_MIN_SIZE = 256  # bytes, smaller bodies aren't worth the headers
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def _file_version(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _optional_version(path):
+    try:
+        return _file_version(path)
+    except FileNotFoundError:
+        return None
+
+
+def load_image_manifest(path=IMAGE_MANIFEST_PATH):
+    """Manifest entries keyed by the .webp path the data files use, {} without one."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    entries = {}
+    for name, entry in manifest.get("images", {}).items():
+        # converted sources are referenced by their .webp output
+        entries[entry.get("webp", name)] = entry
+    return entries
+
+
+class Encoded:
+    """
+    One pre-serialised JSON response and its ETag, plus compressed copies:
+    variants maps a content coding ("br", "gzip") to (body, etag).
+    """
+    __slots__ = ("body", "etag", "variants")
+
+    def __init__(self, obj):
+        # same bytes as Express' res.json
+        self.body = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+        digest = hashlib.sha1(self.body).hexdigest()[:20]
+        self.etag = '"' + digest + '"'
+        self.variants = {}
+        if len(self.body) < COMPRESS_MIN_SIZE:
+            return
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(self.body, quality=BROTLI_QUALITY),
+                                   '"' + digest + '-br"')
+        # mtime=0 so the same data always compresses to the same bytes
+        self.variants["gzip"] = (gzip.compress(self.body, GZIP_LEVEL, mtime=0),
+                                 '"' + digest + '-gzip"')
+
+    def negotiate(self, accept_encoding):
+        """(body, etag, coding) for an Accept-Encoding header; coding None is identity."""
+        if self.variants and accept_encoding:
+            accepted = _accepted_codings(accept_encoding)
+            for coding in ("br", "gzip"):
+                if coding in self.variants and accepted.get(coding, accepted.get("*", 0)) > 0:
+                    body, etag = self.variants[coding]
+                    return body, etag, coding
+        return self.body, self.etag, None
+
+
+def _accepted_codings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _encode_all(items, index):
+    """Responses for the whole list (key None) and for every country."""
+    responses = {None: Encoded(items)}
+    for key, item in index.items():
+        responses[key] = Encoded(item)
+    return responses
+
+
+def webp_dimensions(head):
+    """(width, height) from the first 30 bytes of a WebP file, or (None, None)."""
+    if len(head) < 30 or head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return None, None
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack_from("<HH", head, 26)
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None, None
+
+
+def image_info(url, public_dir=PUBLIC_DIR, manifest=None):
+    """Size of an image under backend/public; bytes is None when it's missing."""
+    info = {"url": url, "path": url, "bytes": None, "width": None, "height": None,
+            "variants": [], "placeholder": None}
+    try:
+        with open(os.path.join(public_dir, url), "rb") as f:
+            info["width"], info["height"] = webp_dimensions(f.read(30))
+            info["bytes"] = os.fstat(f.fileno()).st_size
+    except OSError:
+        pass
+    entry = (manifest or {}).get(url)
+    if entry is not None:
+        info["url"] = entry.get("hashed", url)
+        if info["width"] is None:
+            info["width"], info["height"] = entry.get("width"), entry.get("height")
+        # narrowest first, so the first one wide enough is the one to use
+        info["variants"] = sorted(entry.get("variants", []), key=lambda v: v["width"])
+        info["placeholder"] = entry.get("placeholder")
+    return info
+
+
+def rewrite_images(item, urls):
+    """Copy of a countries/inventions entry with image paths swapped for urls[path]."""
+    item = dict(item)
+    if "images" in item:
+        item["images"] = {k: urls.get(v, v) for k, v in item["images"].items()}
+    if "inventions" in item:
+        item["inventions"] = [
+            dict(i, image=urls[i["image"]]) if i.get("image") in urls else i
+            for i in item["inventions"]
+        ]
+    return item
+
+
+def _image_paths(about, inventions):
+    """(kind, path) pairs: flag, map, food, place, then "invention"."""
+    paths = []
+    if about:
+        paths.extend(about.get("images", {}).items())
+    if inventions:
+        paths.extend(("invention", i["image"]) for i in inventions.get("inventions", []) if i.get("image"))
+    return paths
+
+
+def preload_list(images):
+    """{page: images that exist}, the critical ones first, as that page will request them."""
+    ordered = sorted(images, key=lambda image: image["kind"] not in CRITICAL_IMAGES)
+    pages = {}
+    for page, kinds in PAGE_IMAGES.items():
+        listed = [
+            {"url": image["url"], "path": image["path"], "bytes": image["bytes"],
+             "priority": "high" if image["kind"] in CRITICAL_IMAGES else "low"}
+            for image in ordered if image["kind"] in kinds and image["bytes"] is not None
+        ]
+        if listed:
+            pages[page] = listed
+    return pages
+
+
+def _index(items):
+    index = {}
+    for item in items:
+        # first entry wins, like the Array.find in server.js
+        index.setdefault(item["country"].casefold(), item)
+    return index
+
+
+class ContentStore:
+    def __init__(self, countries_path=COUNTRIES_PATH, inventions_path=INVENTIONS_PATH,
+                 public_dir=PUBLIC_DIR, quiz_bank_path=quizbank.QUIZ_BANK_PATH,
+                 image_manifest_path=IMAGE_MANIFEST_PATH):
+        self.countries_path = countries_path
+        self.inventions_path = inventions_path
+        self.public_dir = public_dir
+        self.quiz_bank_path = quiz_bank_path
+        self.image_manifest_path = image_manifest_path
+        self.lock = threading.Lock()
+        self.version = 0
+        self.load()
+
+    def _versions(self):
+        return (_file_version(self.countries_path), _file_version(self.inventions_path),
+                _optional_version(self.image_manifest_path))
+
+    def load(self):
+        """
+        Builds everything from the files first and only touches the store in
+        the swap at the end, so it can run on another thread (see reload).
+        """
+        versions = self._versions()
+        with open(self.countries_path, "rb") as f:
+            countries_raw = f.read()
+        with open(self.inventions_path, "rb") as f:
+            inventions_raw = f.read()
+        countries = json.loads(countries_raw)
+        inventions = json.loads(inventions_raw)
+
+        digest = quizbank.source_digest(countries_raw, inventions_raw)
+        quiz = quizbank.load(self.quiz_bank_path, digest)
+        if quiz is None:
+            print("Quiz bank missing or out of date, compiling it in memory")
+            quiz = quizbank.compile_bank(countries, inventions)
+
+        manifest = load_image_manifest(self.image_manifest_path)
+        # image paths as written in the files, before any rewriting
+        paths = {}
+        for key, item in _index(countries).items():
+            paths[key] = _image_paths(item, None)
+        for key, item in _index(inventions).items():
+            paths[key] = paths.get(key, []) + _image_paths(None, item)
+
+        urls = {path: entry["hashed"] for path, entry in manifest.items() if entry.get("hashed")}
+        if urls:
+            countries = [rewrite_images(item, urls) for item in countries]
+            inventions = [rewrite_images(item, urls) for item in inventions]
+        countries_index = _index(countries)
+        inventions_index = _index(inventions)
+
+        version = self.version + 1
+        bundles = {}
+        for key, pairs in paths.items():
+            images = [dict(image_info(path, self.public_dir, manifest), kind=kind)
+                      for kind, path in pairs]
+            bundles[key] = self._bundle(key, countries_index, inventions_index, quiz,
+                                        images, version)
+        responses = {
+            "countries": _encode_all(countries, countries_index),
+            "inventions": _encode_all(inventions, inventions_index),
+            "bundle": {key: Encoded(bundle) for key, bundle in bundles.items()},
+            # the newData message QuizPage waits for
+            "quiz": {key: Encoded({"type": "quiz", **entry}) for key, entry in quiz.items()},
+            "preload": {
+                key: Encoded({"type": "preload", "country": bundle["country"],
+                              "pages": bundle["preload"]})
+                for key, bundle in bundles.items()
+            },
+        }
+        with self.lock:
+            self.countries_list = countries
+            self.inventions_list = inventions
+            self.countries = countries_index
+            self.inventions = inventions_index
+            self.bundles = bundles
+            self.responses = responses
+            self.file_versions = versions
+            self.version = version
+
+    def _bundle(self, key, countries_index, inventions_index, quiz, images, version):
+        about = countries_index.get(key)
+        inventions = inventions_index.get(key)
+        return {
+            "country": (about or inventions)["country"],
+            "version": version,
+            "about": about,
+            "inventions": inventions,
+            "quiz": quiz[key]["questions"] if key in quiz else [],
+            "images": images,
+            "preload": preload_list(images),
+        }
+
+    def reload_if_changed(self):
+        """Reload when a data file or the image manifest changed; returns True if it did."""
+        try:
+            versions = self._versions()
+        except FileNotFoundError:
+            return False
+        if versions == self.file_versions:
+            return False
+        try:
+            self.load()
+        except (OSError, ValueError) as e:
+            # probably caught mid-write, the next check tries again
+            print("Content reload failed:", e)
+            return False
+        return True
+
+    async def reload(self):
+        """
+        reload_if_changed on the default executor: compiling the quiz,
+        reading the images and compressing every response would otherwise
+        stall the event loop for as long as it takes.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.reload_if_changed)
+
+    def response(self, kind, name=None):
+        """
+        Encoded response for "countries", "inventions" (all or one country),
+        "bundle", "quiz" or "preload".
+        """
+        return self.responses[kind].get(None if name is None else name.casefold())
+
+    def country(self, name):
+        return self.countries.get(name.casefold())
+
+    def country_inventions(self, name):
+        return self.inventions.get(name.casefold())
+
+    def bundle(self, name):
+        return self.bundles.get(name.casefold())
@@ -0,0 +1,118 @@
+import asyncio
+
+from aiohttp import web
+
+from content import ContentStore
+
+# ----------------------------
+# Content API
+# ----------------------------
+# Serves the same /api/countries and /api/inventions routes as
+# backend/server.js, but from ContentStore: both files are parsed once,
+# every response is serialised (and compressed, see content.py) ahead of
+# time with an ETag, and clients sending If-None-Match get a 304 without a
+# body.
+#
+#   python content_server.py
+#
+# /api/bundle/:country returns the about entry, the inventions and the
+# image sizes for a country in one response, see ContentStore.bundle.
+# /api/quiz/:country is the country's quiz from the compiled bank, ready to
+# forward as a newData message. /api/preload/:country is the ordered list of
+# the country's images with their sizes, per kiosk page.
+#
+# The data files are checked every RELOAD_INTERVAL seconds and reloaded
+# when they change.
+
+HOST = "0.0.0.0"
+PORT = 3001
+RELOAD_INTERVAL = 2  # seconds
+
+# 404 messages, as server.js words them
+NOT_FOUND = {
+    "countries": "Country not found",
+    "inventions": "Inventions not found",
+    "bundle": "Country not found",
+    "quiz": "Quiz not found",
+    "preload": "Country not found",
+}
+
+store = ContentStore()
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def send_encoded(request, encoded):
+    body, etag, coding = encoded.negotiate(request.headers.get("Accept-Encoding"))
+    headers = {
+        "ETag": etag,
+        # kiosks may keep a copy but must check it is still current
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=headers)
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    return web.Response(
+        body=body, content_type="application/json",
+        charset="utf-8", headers=headers,
+    )
+
+
+def list_handler(kind):
+    async def handler(request):
+        return send_encoded(request, store.response(kind))
+    return handler
+
+
+def country_handler(kind):
+    async def handler(request):
+        country = request.match_info["country"]
+        encoded = store.response(kind, country)
+        if encoded is None:
+            return web.json_response(
+                {"error": NOT_FOUND[kind], "requested": country.lower()}, status=404
+            )
+        return send_encoded(request, encoded)
+    return handler
+
+
+async def watch_files(app):
+    async def loop():
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            if await store.reload():
+                print(f"Content reloaded (version {store.version})")
+
+    task = asyncio.create_task(loop())
+    yield
+    task.cancel()
+
+
+def make_app():
+    app = web.Application()
+    for kind in ("countries", "inventions"):
+        app.router.add_get(f"/api/{kind}", list_handler(kind))
+        app.router.add_get(f"/api/{kind}/{{country}}", country_handler(kind))
+    app.router.add_get("/api/bundle/{country}", country_handler("bundle"))
+    app.router.add_get("/api/quiz/{country}", country_handler("quiz"))
+    app.router.add_get("/api/preload/{country}", country_handler("preload"))
+    app.cleanup_ctx.append(watch_files)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(make_app(), host=HOST, port=PORT)
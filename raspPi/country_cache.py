@@ -0,0 +1,124 @@
+import asyncio
+import math
+import os
+from collections import OrderedDict
+
+# ----------------------------
+# Country lookup cache
+# ----------------------------
+# Dwell events keep landing on the same few countries, so resolved results
+# are kept in a bounded LRU keyed by the lat/lon grid cell they fall in.
+# Only cells that lie wholly inside one country, or touch none, share one
+# result (the one for the cell centre). A cell a border or coastline runs
+# through is remembered as such and every point in it is resolved on its
+# own, so a point is never given the country across the border.
+#
+# watch_dataset() watches the files the results were built from and throws
+# everything away (after building a fresh resolver off the event loop)
+# when one changes.
+
+CELL_SIZE = 0.25       # degrees
+MAX_ENTRIES = 4096
+CHECK_INTERVAL = 5.0   # seconds between dataset file checks
+
+BORDER = "border"  # entry for cells that are resolved per point
+
+# what a half-written or hand-edited shape file can raise while loading
+RELOAD_ERRORS = (OSError, ValueError, KeyError, TypeError, IndexError)
+
+
+def _file_version(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class CountryCache:
+    def __init__(self, resolve, classify, cell_size=CELL_SIZE, max_entries=MAX_ENTRIES,
+                 watch=(), reload=None):
+        """
+        resolve(lat, lon) -> result dict, e.g. NearestCountry.resolve
+        classify(box) -> (kind, id) for a lon/lat box, e.g. Geocoder.classify_box;
+        kind None means a border runs through the box
+        watch: dataset files; when one changes the cache is cleared and
+        reload() (if given) must return a new (resolve, classify) pair.
+        """
+        self.resolve = resolve
+        self.classify = classify
+        self.cell_size = cell_size
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.border_lookups = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.watch = list(watch)
+        self.reload = reload
+        self.versions = [_file_version(p) for p in self.watch]
+
+    def key(self, lat, lon):
+        lon = (lon + 180.0) % 360.0 - 180.0
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def get(self, lat, lon):
+        key = self.key(lat, lon)
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            result = self.entries[key] = self.resolve_cell(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        if result is BORDER:
+            self.border_lookups += 1
+            return self.resolve(lat, lon)
+        return result
+
+    def resolve_cell(self, key):
+        size = self.cell_size
+        box = (key[1] * size, key[0] * size, (key[1] + 1) * size, min(90.0, (key[0] + 1) * size))
+        kind, _ = self.classify(box)
+        if kind is None:
+            return BORDER
+        return self.resolve((box[1] + box[3]) / 2, (box[0] + box[2]) / 2)
+
+    async def watch_dataset(self, interval=CHECK_INTERVAL):
+        """Task: reload and clear the cache whenever a watched file changes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            versions = [_file_version(p) for p in self.watch]
+            if versions == self.versions:
+                continue
+            if self.reload is not None:
+                try:
+                    # parsing the shapes and building the trees takes a while
+                    self.resolve, self.classify = await loop.run_in_executor(None, self.reload)
+                except RELOAD_ERRORS as e:
+                    # half-written file or bad data: keep the old resolver, retry later
+                    print("Country data reload failed:", e)
+                    continue
+            self.versions = versions
+            self.invalidate()
+
+    def invalidate(self):
+        self.entries.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "border_lookups": self.border_lookups,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,222 @@
+import argparse
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import time
+
+from geocoder import API_DIR, COUNTRIES_PATH, SHAPES_PATH, Geocoder
+
+# ----------------------------
+# Cube-map country lookup table
+# ----------------------------
+# Offline:  python cubemap.py build --resolution 512
+# Runtime:  CubeMap.open().lookup_vector(v)
+#
+# The sphere is projected onto the six faces of a cube and every face is a
+# resolution x resolution grid of country ids. A unit direction vector
+# resolves with one face pick (largest component) and one array index: no
+# asin/atan2, no polygon test.
+#
+# Vectors are in the earth-fixed frame:
+#   +x -> (0°N, 0°E), +y -> (0°N, 90°E), +z -> North Pole
+# e.g. gustav3's globe frame maps as x = gz, y = gx, z = -gy; globe.py sends
+# its pointing vector in this frame as "v" and listentest.py looks it up here.
+#
+# Cells on a border (their corners disagree, or a polygon vertex falls in
+# them) are stored as BORDER and fall back to the exact geocoder.
+#
+# The header records hashes of countries.json and the shapes; a table built
+# from other data is refused, rebuild it after either changes.
+
+CUBEMAP_PATH = os.path.join(API_DIR, "country_cubemap.bin")
+CUBEMAP_RESOLUTION = 512  # cells per face edge, ~0.18° at face centre
+
+MAGIC = b"CUBEMAP1"
+OCEAN = 0      # no exhibit country
+BORDER = 255   # ask the exact geocoder
+# any other value v is country id v - 1
+
+
+def file_digest(path):
+    """Hash of a dataset file; a table built from other data is stale."""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# ----------------------------
+# Face projection
+# ----------------------------
+def face_uv(x, y, z):
+    ax, ay, az = abs(x), abs(y), abs(z)
+    if ax >= ay and ax >= az:
+        return (0 if x > 0 else 1), y / ax, z / ax
+    if ay >= az:
+        return (2 if y > 0 else 3), x / ay, z / ay
+    return (4 if z > 0 else 5), x / az, y / az
+
+
+def face_vector(face, u, v):
+    """Inverse of face_uv (not normalised)."""
+    s = 1.0 if face % 2 == 0 else -1.0
+    if face < 2:
+        return s, u, v
+    if face < 4:
+        return u, s, v
+    return u, v, s
+
+
+def _cell(u, n):
+    """Grid index of a face coordinate in [-1, 1]."""
+    i = int((u + 1.0) * 0.5 * n)
+    return n - 1 if i >= n else i
+
+
+def vector_latlon(x, y, z):
+    mag = math.sqrt(x * x + y * y + z * z)
+    return math.degrees(math.asin(z / mag)), math.degrees(math.atan2(y, x))
+
+
+def latlon_vector(lat, lon):
+    la, lo = math.radians(lat), math.radians(lon)
+    return math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la)
+
+
+# ----------------------------
+# Build
+# ----------------------------
+def build(geocoder, resolution=CUBEMAP_RESOLUTION, countries_path=COUNTRIES_PATH,
+          shapes_path=SHAPES_PATH):
+    if len(geocoder.countries) >= BORDER - 1:
+        raise ValueError("too many countries for one byte per cell")
+    n = resolution
+    cells = bytearray(6 * n * n)
+
+    def code(lat, lon):
+        country_id = geocoder.lookup_id(lat, lon)
+        return OCEAN if country_id is None else country_id + 1
+
+    for face in range(6):
+        # country codes at the (n + 1) x (n + 1) cell corners of this face
+        corners = []
+        for j in range(n + 1):
+            v = -1.0 + 2.0 * j / n
+            corners.append([code(*vector_latlon(*face_vector(face, -1.0 + 2.0 * i / n, v)))
+                            for i in range(n + 1)])
+
+        base = face * n * n
+        for j in range(n):
+            v = -1.0 + 2.0 * (j + 0.5) / n
+            low, high = corners[j], corners[j + 1]
+            for i in range(n):
+                centre = code(*vector_latlon(*face_vector(face, -1.0 + 2.0 * (i + 0.5) / n, v)))
+                if centre == low[i] == low[i + 1] == high[i] == high[i + 1]:
+                    cells[base + j * n + i] = centre
+                else:
+                    cells[base + j * n + i] = BORDER
+
+    # small islands and slivers can sit between samples; any cell holding
+    # a polygon vertex goes to the exact geocoder too
+    for polygon in geocoder.polygons:
+        for xs, ys in polygon.rings:
+            for lon, lat in zip(xs, ys):
+                face, u, v = face_uv(*latlon_vector(lat, lon))
+                cells[face * n * n + _cell(v, n) * n + _cell(u, n)] = BORDER
+
+    header = {
+        "resolution": n,
+        "countries": geocoder.countries,
+        "countries_sha1": file_digest(countries_path),
+        "shapes_sha1": file_digest(shapes_path),
+        "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return header, cells
+
+
+def write(path, header, cells):
+    raw = json.dumps(header).encode()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(raw)))
+        f.write(raw)
+        f.write(cells)
+    os.replace(tmp, path)
+
+
+# ----------------------------
+# Runtime
+# ----------------------------
+class CubeMap:
+    def __init__(self, path, geocoder=None):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a cube map")
+        (length,) = struct.unpack_from("<I", self.map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.map[start:start + length])
+        self.offset = start + length
+        self.n = self.header["resolution"]
+        self.countries = self.header["countries"]
+        self.geocoder = geocoder
+        self.border_hits = 0
+
+    @classmethod
+    def open(cls, path=CUBEMAP_PATH, geocoder=None, countries_path=COUNTRIES_PATH,
+             shapes_path=SHAPES_PATH):
+        cube = cls(path, geocoder)
+        for key, source in (("countries_sha1", countries_path), ("shapes_sha1", shapes_path)):
+            if cube.header.get(key) != file_digest(source):
+                cube.close()
+                raise ValueError(f"{path} was built from another {os.path.basename(source)}, "
+                                 "rebuild it")
+        return cube
+
+    def lookup_vector_id(self, v):
+        """Country id for an earth-fixed direction vector, None for ocean."""
+        x, y, z = v
+        face, u, w = face_uv(x, y, z)
+        n = self.n
+        value = self.map[self.offset + (face * n + _cell(w, n)) * n + _cell(u, n)]
+        if value == BORDER:
+            self.border_hits += 1
+            if self.geocoder is None:
+                return None
+            return self.geocoder.lookup_id(*vector_latlon(x, y, z))
+        return None if value == OCEAN else value - 1
+
+    def lookup_vector(self, v):
+        country_id = self.lookup_vector_id(v)
+        return None if country_id is None else self.countries[country_id]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cube-map country lookup table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="rasterise the country shapes into a cube map")
+    b.add_argument("--resolution", type=int, default=CUBEMAP_RESOLUTION)
+    b.add_argument("--shapes", default=SHAPES_PATH)
+    b.add_argument("--out", default=CUBEMAP_PATH)
+    q = sub.add_parser("lookup", help="look up one lat/lon through the cube map")
+    q.add_argument("lat", type=float)
+    q.add_argument("lon", type=float)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.time()
+        header, cells = build(Geocoder.load(args.shapes), args.resolution,
+                              shapes_path=args.shapes)
+        write(args.out, header, cells)
+        border = cells.count(BORDER)
+        print(f"Wrote {args.out}: 6x{args.resolution}x{args.resolution} cells, "
+              f"{100 * border / len(cells):.1f}% border, {time.time() - started:.1f}s")
+    else:
+        cube = CubeMap.open(geocoder=Geocoder.load())
+        print(cube.lookup_vector(latlon_vector(args.lat, args.lon)))
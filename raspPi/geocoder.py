@@ -0,0 +1,305 @@
+import json
+import math
+import os
+import sys
+
+# ----------------------------
+# Offline reverse geocoder
+# ----------------------------
+# Resolves lat/lon to one of the exhibit countries from countries.json
+# without asking Node-RED. Country outlines come from a GeoJSON file of
+# simplified admin-0 polygons at SHAPES_PATH, built from Natural Earth
+# 1:50m "Admin 0 - Countries" by build_shapes.py. Features whose name
+# isn't an exhibit country are skipped at load time.
+#
+# Candidates are found with an R-tree over polygon bounding boxes, and only
+# those get the exact point-in-polygon test.
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", "api")
+COUNTRIES_PATH = os.path.join(API_DIR, "countries.json")
+SHAPES_PATH = os.path.join(API_DIR, "country_shapes.geojson")
+
+# feature properties that may hold the country name, tried in order. Not
+# SOVEREIGNT: Greenland or Puerto Rico must not count as inside Denmark or
+# the United States, they get the nearest-country fallback instead.
+NAME_KEYS = ("ADMIN", "NAME_LONG", "NAME", "NAME_EN", "admin", "name")
+
+# shape-file spellings of exhibit countries that are named differently
+ALIASES = {
+    "turkey": "Türkiye",
+    "turkiye": "Türkiye",
+    "united states of america": "United States",
+    "united arab emirates": "UAE",
+    "czechia": "Czech Republic",
+    "myanmar": "Myanmar (Burma)",
+    "burma": "Myanmar (Burma)",
+    "bosnia and herz.": "Bosnia and Herzegovina",
+    "dem. rep. congo": "Democratic Republic of the Congo",
+    "congo, the democratic republic of the": "Democratic Republic of the Congo",
+    "republic of serbia": "Serbia",
+    "republic of korea": "South Korea",
+    "korea": "South Korea",
+    "russian federation": "Russia",
+    "viet nam": "Vietnam",
+}
+
+RTREE_NODE_SIZE = 8
+
+# classify_box() results
+INSIDE = "inside"
+OUTSIDE = "outside"
+
+
+def load_exhibit_countries(path=COUNTRIES_PATH):
+    """Country names from countries.json, in file order, without duplicates."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    names = []
+    for item in data:
+        if item["country"] not in names:
+            names.append(item["country"])
+    return names
+
+
+def normalize_lon(lon):
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+# ----------------------------
+# Point in polygon
+# ----------------------------
+def point_in_ring(x, y, xs, ys):
+    """Even-odd ray casting against one closed ring."""
+    inside = False
+    j = len(xs) - 1
+    for i in range(len(xs)):
+        xi, yi = xs[i], ys[i]
+        xj, yj = xs[j], ys[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def segment_hits_box(x1, y1, x2, y2, box):
+    """Whether the segment touches the box (min_x, min_y, max_x, max_y), Liang-Barsky."""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - box[0]), (dx, box[2] - x1), (-dy, y1 - box[1]), (dy, box[3] - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+    return True
+
+
+class Polygon:
+    __slots__ = ("country_id", "bbox", "rings")
+
+    def __init__(self, country_id, rings):
+        # rings[0] is the outline, the rest are holes (lakes, enclaves)
+        self.country_id = country_id
+        self.rings = [([p[0] for p in ring], [p[1] for p in ring]) for ring in rings]
+        xs, ys = self.rings[0]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def contains(self, lon, lat):
+        xs, ys = self.rings[0]
+        if not point_in_ring(lon, lat, xs, ys):
+            return False
+        for xs, ys in self.rings[1:]:
+            if point_in_ring(lon, lat, xs, ys):
+                return False
+        return True
+
+    def crosses(self, box):
+        """Whether any edge of any ring passes through the box."""
+        for xs, ys in self.rings:
+            j = len(xs) - 1
+            for i in range(len(xs)):
+                if segment_hits_box(xs[j], ys[j], xs[i], ys[i], box):
+                    return True
+                j = i
+        return False
+
+
+# ----------------------------
+# R-tree over bounding boxes
+# ----------------------------
+def _overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _union(boxes):
+    return (
+        min(b[0] for b in boxes), min(b[1] for b in boxes),
+        max(b[2] for b in boxes), max(b[3] for b in boxes),
+    )
+
+
+class RTree:
+    """
+    Static R-tree, bulk loaded with Sort-Tile-Recursive packing.
+    Nodes are (bbox, is_leaf, children); leaf children are (bbox, item).
+    """
+
+    def __init__(self, entries, node_size=RTREE_NODE_SIZE):
+        self.node_size = node_size
+        entries = list(entries)
+        if not entries:
+            self.root = None
+            return
+        # pack leaves first, then keep packing nodes until one is left
+        level = self._pack(entries, leaf=True)
+        while len(level) > 1:
+            level = self._pack([(node[0], node) for node in level], leaf=False)
+        self.root = level[0]
+
+    def _pack(self, entries, leaf):
+        n = self.node_size
+        slices = max(1, math.ceil(math.sqrt(math.ceil(len(entries) / n))))
+        per_slice = slices * n
+        entries.sort(key=lambda e: (e[0][0] + e[0][2]) / 2)
+        nodes = []
+        for s in range(0, len(entries), per_slice):
+            chunk = sorted(entries[s:s + per_slice], key=lambda e: (e[0][1] + e[0][3]) / 2)
+            for k in range(0, len(chunk), n):
+                group = chunk[k:k + n]
+                children = group if leaf else [e[1] for e in group]
+                nodes.append((_union([e[0] for e in group]), leaf, children))
+        return nodes
+
+    def query(self, x, y):
+        """Items whose bounding box contains (x, y)."""
+        return self.query_box((x, y, x, y))
+
+    def query_box(self, box):
+        """Items whose bounding box overlaps box (min_x, min_y, max_x, max_y)."""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            bbox, leaf, children = stack.pop()
+            if not _overlaps(bbox, box):
+                continue
+            if leaf:
+                found.extend(item for cb, item in children if _overlaps(cb, box))
+            else:
+                stack.extend(children)
+        return found
+
+
+# ----------------------------
+# Geocoder
+# ----------------------------
+def _feature_country(properties, lookup):
+    for key in NAME_KEYS:
+        value = properties.get(key)
+        if not value:
+            continue
+        folded = str(value).casefold()
+        if folded in lookup:
+            return lookup[folded]
+        if folded in ALIASES:
+            return lookup[ALIASES[folded].casefold()]
+    return None
+
+
+def _geometry_polygons(geometry):
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return []
+
+
+class Geocoder:
+    def __init__(self, countries, polygons):
+        self.countries = countries  # country id -> name
+        self.polygons = polygons
+        self.index = RTree([(p.bbox, p) for p in polygons])
+
+    @classmethod
+    def load(cls, shapes_path=SHAPES_PATH, countries_path=COUNTRIES_PATH):
+        countries = load_exhibit_countries(countries_path)
+        lookup = {name.casefold(): i for i, name in enumerate(countries)}
+
+        with open(shapes_path, encoding="utf-8") as f:
+            shapes = json.load(f)
+
+        polygons = []
+        for feature in shapes.get("features", []):
+            country_id = _feature_country(feature.get("properties") or {}, lookup)
+            if country_id is None:
+                continue
+            for rings in _geometry_polygons(feature.get("geometry")):
+                if rings and len(rings[0]) >= 3:
+                    polygons.append(Polygon(country_id, rings))
+        return cls(countries, polygons)
+
+    def missing(self):
+        """Exhibit countries that have no outline in the shape file."""
+        covered = {p.country_id for p in self.polygons}
+        return [name for i, name in enumerate(self.countries) if i not in covered]
+
+    def lookup_id(self, lat, lon):
+        lon = normalize_lon(lon)
+        for polygon in self.index.query(lon, lat):
+            if polygon.contains(lon, lat):
+                return polygon.country_id
+        return None
+
+    def classify_box(self, box):
+        """
+        What a lon/lat box (min_lon, min_lat, max_lon, max_lat) lies in:
+        INSIDE and the country id when it is wholly inside one country,
+        OUTSIDE and None when it touches no country, (None, None) when an
+        outline runs through it and every point has to be looked up.
+        """
+        candidates = self.index.query_box(box)
+        if any(polygon.crosses(box) for polygon in candidates):
+            return None, None
+        # no edge inside the box: any point tells for all of it
+        lon, lat = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        for polygon in candidates:
+            if polygon.contains(lon, lat):
+                return INSIDE, polygon.country_id
+        return OUTSIDE, None
+
+    def lookup(self, lat, lon):
+        """Exhibit country name at lat/lon, or None (ocean, non-exhibit country)."""
+        country_id = self.lookup_id(lat, lon)
+        return None if country_id is None else self.countries[country_id]
+
+    def lookup_many(self, points):
+        """Batch version of lookup() for (lat, lon) pairs, e.g. dwell logs."""
+        lookup_id = self.lookup_id
+        names = self.countries
+        results = []
+        for lat, lon in points:
+            country_id = lookup_id(lat, lon)
+            results.append(None if country_id is None else names[country_id])
+        return results
+
+
+if __name__ == "__main__":
+    # python geocoder.py            -> coverage check of the shape file
+    # python geocoder.py LAT LON    -> single lookup
+    geocoder = Geocoder.load()
+    if len(sys.argv) == 3:
+        print(geocoder.lookup(float(sys.argv[1]), float(sys.argv[2])))
+    else:
+        print(f"{len(geocoder.polygons)} polygons for {len(geocoder.countries)} exhibit countries")
+        missing = geocoder.missing()
+        if missing:
+            print("No outline for:", ", ".join(missing))
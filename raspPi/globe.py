@@ -8,15 +8,37 @@ import busio
 import digitalio
 import sys
 import select
+import socket
 
 from adafruit_bno08x.i2c import BNO08X_I2C
 from adafruit_bno08x import BNO_REPORT_ROTATION_VECTOR
 
+from loop_profiler import LoopProfiler, serve_status
+from tracing import ClockOffset, mark, new_trace
+from udp_transport import UdpCoordSender
+
 # ----------------------------
 # WebSocket config
 # ----------------------------
 WS_URI = "ws://10.22.62.39:8765"
 
+# "ws"  -> everything over the websocket
+# "udp" -> position samples as UDP datagrams, events still over the websocket
+TRANSPORT = "ws"
+UDP_HOST = "10.22.62.39"
+UDP_PORT = 8766
+DEVICE_ID = socket.gethostname()
+
+# attach a trace (id + per-hop timestamps) to every sample, see tracing.py
+TRACE_ENABLED = True
+CLOCK_SYNC_INTERVAL = 5  # seconds between clock offset pings to the relay
+clock = ClockOffset()
+
+# per-stage timings of the main loop, printed on 'p', see loop_profiler.py
+PROFILE_ENABLED = True
+PROFILE_STATUS_PORT = None  # e.g. 9101 to serve them over TCP as well
+profiler = LoopProfiler(enabled=PROFILE_ENABLED)
+
 # ----------------------------
 # RESET PIN
 # ----------------------------
@@ -111,6 +133,20 @@ def vectors_to_lat_lon(up, forward):
 
     return latitude, longitude
 
+def pointing_vector(up, forward):
+    """
+    The same direction as vectors_to_lat_lon as an earth-fixed unit vector
+    (+x = 0N 0E, +y = 0N 90E, +z = north pole), see cubemap.py.
+    """
+    uz = max(-1.0, min(1.0, up[2]))
+    fx, fy = forward[0], forward[1]
+    c = math.sqrt(1.0 - uz * uz)
+    h = math.hypot(fx, fy)
+    if h == 0:
+        return c, 0.0, uz
+    # longitude is -atan2(fy, fx), hence the flipped y
+    return c * fx / h, -c * fy / h, uz
+
 # ----------------------------
 # Calibration
 # ----------------------------
@@ -129,24 +165,65 @@ def key_pressed():
     dr, dw, de = select.select([sys.stdin], [], [], 0)
     return dr != []
 
+# ----------------------------
+# Clock sync with the relay
+# ----------------------------
+async def clock_sync_ping(websocket):
+    while True:
+        await websocket.send(json.dumps({"type": "clock_sync", "t0": time.time()}))
+        await asyncio.sleep(CLOCK_SYNC_INTERVAL)
+
+async def read_relay_messages(websocket):
+    async for message in websocket:
+        t3 = time.time()
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            continue
+        if data.get("type") == "clock_sync" and data.get("t0") is not None:
+            clock.add(data["t0"], data["t1"], data["t2"], t3)
+
 # ----------------------------
 # Main loop
 # ----------------------------
 async def send_coordinates():
     global sensor
+    udp = UdpCoordSender(UDP_HOST, UDP_PORT, DEVICE_ID) if TRANSPORT == "udp" else None
+
     async with websockets.connect(WS_URI) as websocket:
         print("Connected to WebSocket server!")
+        if udp:
+            print(f"Streaming positions over udp://{UDP_HOST}:{UDP_PORT}")
+        background = []  # kept referenced for as long as the connection is open
+        if TRACE_ENABLED:
+            background.append(asyncio.create_task(clock_sync_ping(websocket)))
+            background.append(asyncio.create_task(read_relay_messages(websocket)))
+        if PROFILE_ENABLED and PROFILE_STATUS_PORT:
+            serve_status(profiler, port=PROFILE_STATUS_PORT)
 
         while True:
+            profiler.start()
             # Calibration trigger
             if key_pressed():
                 ch = sys.stdin.read(1)
                 if ch.lower() == "c":
                     calibrate(sensor.quaternion)
+                    await websocket.send(json.dumps({
+                        "type": "calibration",
+                        "device": DEVICE_ID,
+                    }))
+                elif ch.lower() == "p":
+                    print(profiler.report())
+            profiler.stage("keys")
 
             try:
+                trace = new_trace() if TRACE_ENABLED else None
+                mark(trace, "imu_start")
+
                 # Read quaternion
                 x, y, z, w = sensor.quaternion
+                mark(trace, "imu_read")
+                profiler.stage("imu_read")
                 if (x, y, z, w) == (0, 0, 0, 0):
                     await asyncio.sleep(0.01)
                     continue
@@ -166,16 +243,31 @@ async def send_coordinates():
 
                 # Compute latitude and longitude
                 lat, lon = vectors_to_lat_lon(up_world, forward_world)
-
-                msg = json.dumps({
-                    "lat": round(lat, 3),
-                    "lon": round(lon, 3),
-                })
-
-                await websocket.send(msg)
+                mark(trace, "latlon")
+                profiler.stage("math")
+
+                # lets the relay resolve the country from its cube map
+                extra = {"v": [round(c, 4) for c in pointing_vector(up_world, forward_world)]}
+                if trace is not None:
+                    trace["clock_offset"] = clock.offset
+                    extra["trace"] = mark(trace, "sent")
+
+                if udp:
+                    msg = udp.send(round(lat, 3), round(lon, 3), **extra)
+                else:
+                    msg = json.dumps({
+                        "device": DEVICE_ID,
+                        "lat": round(lat, 3),
+                        "lon": round(lon, 3),
+                        **extra,
+                    })
+                    await websocket.send(msg)
+                profiler.stage("send")
                 print("Sent:", msg)
+                profiler.stage("print")
 
                 await asyncio.sleep(1)  # ~10 Hz
+                profiler.stage("sleep")
 
             except OSError:
                 print("\n⚠️ I2C error — resetting sensor…")
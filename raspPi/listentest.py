@@ -5,68 +5,401 @@ import time
 import math
 import requests
 
+from content import ContentStore
+from country_cache import CHECK_INTERVAL, CountryCache
+from cubemap import CUBEMAP_PATH, CubeMap
+from geocoder import COUNTRIES_PATH, SHAPES_PATH, Geocoder
+from nearest import NearestCountry
+from relay_metrics import Metrics, RateMeter, serve_metrics
+from relay_workers import run_workers
+from stability import STABILITY_ROOM, STABILITY_TIME
+from tracing import HopHistograms, hop_durations, mark
+from udp_transport import UdpCoordProtocol
+
 HOST = "0.0.0.0"
 PORT = 8765
 
+# optional low-latency path for pointer samples (see udp_transport.py);
+# events such as calibration still arrive over the websocket
+UDP_ENABLED = True
+UDP_PORT = 8766
+
 RED_URI= "http://127.0.0.1:1880/coords"
+NODERED_TIMEOUT = 5  # seconds
+
+# number of relay processes sharing PORT / UDP_PORT via SO_REUSEPORT,
+# see relay_workers.py. 1 keeps the plain single-process relay.
+WORKERS = 1
+worker = None  # WorkerContext when running as one of several workers
+
+# per-hop latency histograms from traced messages (see tracing.py)
+TRACE_EXPORT_PATH = "trace_histograms.json"
+TRACE_EXPORT_INTERVAL = 10  # seconds
+hop_histograms = HopHistograms()
+
+# resolve the country locally (see geocoder.py) and send it along to Node-RED;
+# points in the sea snap to the nearest exhibit country within this many degrees
+GEOCODER_ENABLED = True
+NEAREST_MAX_DISTANCE = 5.0
+COUNTRY_CELL_SIZE = 0.25  # degrees, lookups are cached per grid cell
+country_cache = None
+
+# samples carrying the globe's pointing vector ("v") resolve through the
+# precomputed cube map (see cubemap.py); sea and senders without a vector
+# go through country_cache as before
+CUBEMAP_ENABLED = True
+cube_map = None
 
-# stability configs
-stability_room = 3  # degrees
-stability_time = 3  # seconds
-request_sent = False
+# send the country's content (see content.py) along with the Node-RED
+# request when a dwell completes
+CONTENT_ENABLED = True
+content_store = None
 
-# store last coordinates and timestamp
-last_coords = None
-stable_since = None
+# plain-text metrics on a side port, see relay_metrics.py
+# (each worker listens on METRICS_PORT + its index)
+METRICS_ENABLED = True
+METRICS_PORT = 9100
+VERBOSE = False  # print every sample; slow at high rates
+
+connections = set()
+udp_protocol = None
+
+metrics = Metrics()
+message_rates = RateMeter()
+metrics.describe("messages_total", "Position samples received, by device and transport")
+metrics.describe("decode_errors_total", "Messages that were not valid JSON")
+metrics.describe("handle_seconds", "Dwell handling per sample, without the Node-RED request")
+metrics.describe("nodered_dispatch_seconds", "POST to Node-RED until its response")
+metrics.describe("nodered_errors_total", "Node-RED requests that failed")
+metrics.gauge("device_messages_per_second", lambda: {
+    (("device", device),): rate for device, rate in message_rates.rates().items()
+})
+metrics.gauge("connections", lambda: len(connections))
+metrics.gauge("active_devices", lambda: len(dwell))
+metrics.gauge("udp_dropped_stale", lambda: udp_protocol.dropped_stale if udp_protocol else 0)
+metrics.gauge("udp_dropped_invalid", lambda: udp_protocol.dropped_invalid if udp_protocol else 0)
+
+# per device: last coordinates, timestamp and whether the request went out
+dwell = {}
+
+def dwell_state(device):
+    state = dwell.get(device)
+    if state is None:
+        state = dwell[device] = {
+            "last_coords": None,
+            "stable_since": None,
+            "request_sent": False,
+            "request_pending": False,  # POST to Node-RED in flight
+        }
+    return state
 
 def coords_within_room(c1, c2, room):
     """Check if coordinates c1 and c2 are within `room` degrees"""
     return math.isclose(c1[0], c2[0], abs_tol=room) and math.isclose(c1[1], c2[1], abs_tol=room)
 
-async def handle_client(websocket):
-    global request_sent, last_coords, stable_since
+def handle_coords(device, lat, lon, trace=None, direction=None):
+    """Run one position sample through the stability check."""
+    started = time.perf_counter()
+    state = dwell_state(device)
+
+    if VERBOSE:
+        print(f"Received from {device}: lat={lat:.6f}, lon={lon:.6f}")
+
+    send_request = False
+    if state["last_coords"] is None:
+        state["last_coords"] = (lat, lon)
+        state["stable_since"] = time.time()
+    else:
+        if coords_within_room((lat, lon), state["last_coords"], STABILITY_ROOM):
+            # coordinates are stable
+            if (time.time() - state["stable_since"] >= STABILITY_TIME
+                    and not state["request_sent"] and not state["request_pending"]):
+                send_request = True
+        else:
+            # reset if coordinates moved
+            state["last_coords"] = (lat, lon)
+            state["stable_since"] = time.time()
+            state["request_sent"] = False
+    mark(trace, "relay_done")
+    metrics.observe("handle_seconds", time.perf_counter() - started)
+
+    if send_request:
+        print("Coordinates stable, sending request...")
+        payload = {
+            "lat": lat,
+            "long": lon,
+            "device": device
+        }
+        if country_cache is not None:
+            match = resolve_country(lat, lon, direction)
+            payload["country"] = match["country"]
+            payload["country_distance"] = match["distance"]  # degrees, 0 when inside
+            payload["country_match"] = match["match"]        # "in", "near" or None
+            if content_store is not None and match["country"] is not None:
+                payload["content"] = content_store.bundle(match["country"])
+        if trace is not None:
+            mark(trace, "nodered_sent")
+            payload["trace"] = trace
+        # the POST runs on the default executor, the loop keeps taking samples
+        state["request_pending"] = True
+        stable_since = state["stable_since"]
+        future = asyncio.get_running_loop().run_in_executor(None, post_to_nodered, payload)
+        future.add_done_callback(lambda f: nodered_answered(state, stable_since, trace, f.result()))
+        return
+
+    if trace is not None:
+        hop_histograms.observe_trace(trace)
+
+def direction_of(data):
+    """The sample's earth-fixed pointing vector, if the sender included one."""
+    v = data.get("v")
+    if (isinstance(v, list) and len(v) == 3
+            and all(isinstance(c, (int, float)) for c in v) and any(v)):
+        return tuple(v)
+    return None
+
+def resolve_country(lat, lon, direction):
+    """Same result shape as NearestCountry.resolve."""
+    cube = cube_map
+    if cube is not None and direction is not None:
+        country_id = cube.lookup_vector_id(direction)
+        if country_id is not None:
+            return {"id": country_id, "country": cube.countries[country_id],
+                    "distance": 0.0, "match": "in"}
+    # sea (snapped to the nearest country) or no vector
+    return country_cache.get(lat, lon)
+
+def post_to_nodered(payload):
+    """(response text or None, error or None, seconds); runs off the event loop."""
+    started = time.perf_counter()
+    text = error = None
+    try:
+        text = requests.post(RED_URI, json=payload, timeout=NODERED_TIMEOUT).text
+    except requests.RequestException as e:
+        error = e
+    finally:
+        seconds = time.perf_counter() - started
+    return text, error, seconds
+
+def nodered_answered(state, stable_since, trace, result):
+    """Back on the event loop once Node-RED answered or the POST failed."""
+    text, error, seconds = result
+    state["request_pending"] = False
+    # failures and timeouts count too, or the slow requests drop out of the histogram
+    metrics.observe("nodered_dispatch_seconds", seconds)
+    if error is not None:
+        # request_sent stays False, so the next stable sample retries
+        metrics.inc("nodered_errors_total")
+        print("Node-RED request failed:", error)
+        return
+    mark(trace, "nodered_done")
+    print("response:", text)
+    # unless the globe moved on while the request was out
+    if state["stable_since"] == stable_since:
+        state["request_sent"] = True
+    # here you can send a request or trigger an action
+    if trace is not None:
+        hop_histograms.observe_trace(trace)
+
+def handle_event(device, data):
+    """Events that must not be lost, so they only come over the websocket."""
+    if data.get("type") == "calibration":
+        print(f"Calibration event from {device}")
+        # the old reference frame is gone, start dwell detection over
+        dwell.pop(device, None)
 
+def dispatch_coords(device, lat, lon, trace=None, direction=None):
+    """Handle a sample here, or hand it to the worker that owns the device."""
+    if worker is not None and not worker.owns(device):
+        worker.send_to(worker.owner_of(device), ("coords", device, lat, lon, trace, direction))
+        return
+    handle_coords(device, lat, lon, trace, direction)
+
+def dispatch_event(device, data):
+    if worker is not None and not worker.owns(device):
+        worker.send_to(worker.owner_of(device), ("event", device, data))
+        return
+    handle_event(device, data)
+
+def handle_inbox(item):
+    """Work forwarded from another worker."""
+    kind = item[0]
+    if kind == "coords":
+        handle_coords(*item[1:])
+    elif kind == "event":
+        handle_event(*item[1:])
+
+async def handle_client(websocket):
     print(f"New client connected: {websocket.remote_address}")
+    address = websocket.remote_address
+    connections.add(websocket)
     try:
         async for message in websocket:
+            received_at = time.time()
             try:
                 data = json.loads(message)
+                if data.get("type") == "clock_sync":
+                    # answer the Pi's ping so it can estimate its clock offset
+                    await websocket.send(json.dumps({
+                        "type": "clock_sync",
+                        "t0": data.get("t0"),
+                        "t1": received_at,
+                        "t2": time.time(),
+                    }))
+                    continue
+
+                # senders without a device id are told apart by address
+                device = data.get("device") or f"{address[0]}:{address[1]}"
+
+                if data.get("type"):
+                    dispatch_event(device, data)
+                    continue
                 lat = data.get("lat")
                 lon = data.get("lon")
                 if lat is not None and lon is not None:
-                    print(f"Received: lat={lat:.6f}, lon={lon:.6f}")
-
-                    if last_coords is None:
-                        last_coords = (lat, lon)
-                        stable_since = time.time()
-                    else:
-                        if coords_within_room((lat, lon), last_coords, stability_room):
-                            # coordinates are stable
-                            if time.time() - stable_since >= stability_time and not request_sent:
-                                print("Coordinates stable, sending request...")
-                                payload = {
-                                    "lat": lat,
-                                    "long": lon
-                                }
-                                response = requests.post(RED_URI, json=payload)
-                                print("response:", response.text)
-                                request_sent = True
-                                # here you can send a request or trigger an action
-                        else:
-                            # reset if coordinates moved
-                            last_coords = (lat, lon)
-                            stable_since = time.time()
-                            request_sent = False
+                    # label by DEVICE_ID only: ip:port changes on every reconnect
+                    label = data.get("device") or "unknown"
+                    metrics.inc("messages_total", device=label, transport="ws")
+                    message_rates.mark(label)
+                    dispatch_coords(device, lat, lon, mark(data.get("trace"), "relay_recv", received_at),
+                                    direction_of(data))
 
             except json.JSONDecodeError:
-                print("Received invalid JSON:", message)
+                metrics.inc("decode_errors_total")
+                if VERBOSE:
+                    print("Received invalid JSON:", message)
     except websockets.ConnectionClosed:
         print("Client disconnected.")
+    finally:
+        connections.discard(websocket)
+
+def handle_datagram(data, addr, device):
+    lat = data.get("lat")
+    lon = data.get("lon")
+    if lat is not None and lon is not None:
+        # same labels as the websocket path, never the ip:port fallback
+        label = data.get("device") or "unknown"
+        metrics.inc("messages_total", device=label, transport="udp")
+        message_rates.mark(label)
+        dispatch_coords(device, lat, lon, mark(data.get("trace"), "relay_recv"), direction_of(data))
+
+async def watch_content():
+    while True:
+        await asyncio.sleep(CHECK_INTERVAL)
+        if await content_store.reload():
+            print("Country content changed, reloaded")
+
+def handle_post(path, body):
+    """
+    server.js posts each trace back once it has emitted it to the kiosk
+    (POST /traces), which closes the Node-RED -> Socket.IO hop.
+    """
+    if path != "/traces":
+        return False
+    try:
+        trace = json.loads(body)
+    except ValueError:
+        return True
+    if isinstance(trace, dict):
+        for hop, seconds in hop_durations(trace).items():
+            # the hops before it were recorded when the relay handled the sample
+            if hop.endswith("->socketio_emit"):
+                hop_histograms.observe(hop, seconds)
+    return True
+
+async def export_traces(path):
+    while True:
+        await asyncio.sleep(TRACE_EXPORT_INTERVAL)
+        if hop_histograms.hops:
+            hop_histograms.write_json(path)
+
+def build_resolver():
+    geocoder = Geocoder.load()
+    missing = geocoder.missing()
+    if missing:
+        print("Geocoder has no outline for:", ", ".join(missing))
+    resolver = NearestCountry(geocoder)
+    if CUBEMAP_ENABLED:
+        load_cube_map(geocoder)
+    return lambda lat, lon: resolver.resolve(lat, lon, NEAREST_MAX_DISTANCE), geocoder.classify_box
+
+def load_cube_map(geocoder):
+    """
+    Reopened together with the geocoder, so a table that no longer matches
+    countries.json or the shapes is dropped instead of answering stale.
+    """
+    global cube_map
+    try:
+        cube_map = CubeMap.open(geocoder=geocoder)
+    except FileNotFoundError:
+        cube_map = None
+        print(f"No cube map at {CUBEMAP_PATH}, resolving countries from lat/lon. "
+              "Run cubemap.py build to create it.")
+    except ValueError as e:
+        cube_map = None
+        print("WARNING: cube map not used:", e)
+
+def load_geocoder():
+    global country_cache
+    try:
+        resolve, classify = build_resolver()
+    except FileNotFoundError:
+        # the shape file is built, not checked in (see build_shapes.py)
+        print(f"WARNING: no country shapes at {SHAPES_PATH}, leaving the country lookup "
+              "to Node-RED. Run build_shapes.py to resolve countries here.")
+        return
+    # rebuilt from scratch when countries.json, the shapes or the cube map change
+    country_cache = CountryCache(
+        resolve, classify, COUNTRY_CELL_SIZE,
+        watch=[COUNTRIES_PATH, SHAPES_PATH, CUBEMAP_PATH], reload=build_resolver,
+    )
+    for key in ("hits", "misses", "border_lookups", "evictions", "invalidations"):
+        metrics.gauge(f"country_cache_{key}", lambda key=key: country_cache.stats()[key])
+
+def load_content():
+    global content_store
+    try:
+        content_store = ContentStore()
+    except (OSError, ValueError) as e:
+        print("Country content not available, sending requests without it:", e)
+
+async def main(ctx=None):
+    global worker, udp_protocol
+    if GEOCODER_ENABLED:
+        load_geocoder()
+    if CONTENT_ENABLED and country_cache is not None:
+        load_content()
+    worker = ctx
+    reuse_port = ctx is not None
+    trace_path = TRACE_EXPORT_PATH
+    if ctx is not None:
+        ctx.start_inbox(handle_inbox)
+        trace_path = TRACE_EXPORT_PATH.replace(".json", f".{ctx.index}.json")
+
+    if UDP_ENABLED:
+        loop = asyncio.get_running_loop()
+        _, udp_protocol = await loop.create_datagram_endpoint(
+            lambda: UdpCoordProtocol(handle_datagram),
+            local_addr=(HOST, UDP_PORT),
+            reuse_port=reuse_port,
+        )
+        print(f"UDP coordinate endpoint on udp://{HOST}:{UDP_PORT}")
+
+    # referenced here for as long as main() runs, so they aren't collected
+    background = [asyncio.create_task(export_traces(trace_path))]
+    if country_cache is not None:
+        background.append(asyncio.create_task(country_cache.watch_dataset()))
+    if content_store is not None:
+        background.append(asyncio.create_task(watch_content()))
+    if METRICS_ENABLED:
+        await serve_metrics(metrics, HOST, METRICS_PORT + (ctx.index if ctx else 0), on_post=handle_post)
 
-async def main():
-    async with websockets.serve(handle_client, HOST, PORT):
+    async with websockets.serve(handle_client, HOST, PORT, reuse_port=reuse_port):
         print(f"WebSocket server running on ws://{HOST}:{PORT}")
         await asyncio.Future()  # run forever
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1:
+        run_workers(main, WORKERS)
+    else:
+        asyncio.run(main())
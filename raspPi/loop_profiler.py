@@ -0,0 +1,115 @@
+import socket
+import threading
+import time
+from collections import deque
+
+from tracing import Histogram
+
+# ----------------------------
+# Sensor loop profiler
+# ----------------------------
+# Times every stage of a main-loop iteration and keeps a rolling window of
+# them, cheap enough to leave on (a perf_counter() and a Histogram.observe()
+# per stage, no sorting until someone asks):
+#
+#   profiler.start()              top of the loop
+#   profiler.stage("imu_read")    end of each stage, time since the last mark
+#
+# The loop period is start() to start(), so it includes the sleep and any
+# iteration that bailed out early. Percentiles are taken over the last
+# `window` samples of each stage when report() or snapshot() is called.
+#
+# Viewing it: the sensor scripts print report() on 'p', and serve_status()
+# answers every connection on a side port with it:
+#
+#   nc pi-host 9101
+
+PROFILE_WINDOW = 500  # samples per stage, about a minute at 10 Hz
+STATUS_PORT = 9101
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class LoopProfiler:
+    def __init__(self, window=PROFILE_WINDOW, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.stages = {}  # name -> Histogram, in the order they ran
+        self.period = Histogram(window=window)
+        self.starts = deque(maxlen=window)
+        self.last = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.starts:
+            self.period.observe(now - self.starts[-1])
+        self.starts.append(now)
+        self.last = now
+
+    def stage(self, name):
+        if not self.enabled or self.last is None:
+            return
+        now = time.perf_counter()
+        hist = self.stages.get(name)
+        if hist is None:
+            hist = self.stages[name] = Histogram(window=self.window)
+        hist.observe(now - self.last)
+        self.last = now
+
+    def rate(self):
+        """Iterations per second over the window."""
+        starts = list(self.starts)
+        if len(starts) < 2 or starts[-1] == starts[0]:
+            return None
+        return (len(starts) - 1) / (starts[-1] - starts[0])
+
+    @staticmethod
+    def _summary(hist):
+        return {
+            "count": hist.count,
+            "p50_ms": _ms(hist.percentile(50)),
+            "p95_ms": _ms(hist.percentile(95)),
+            "max_ms": _ms(max(hist.recent) if hist.recent else None),
+        }
+
+    def snapshot(self):
+        rate = self.rate()
+        return {
+            "rate_hz": None if rate is None else round(rate, 2),
+            "loop": self._summary(self.period),
+            "stages": {name: self._summary(hist) for name, hist in list(self.stages.items())},
+        }
+
+    def report(self):
+        snap = self.snapshot()
+        rate = "-" if snap["rate_hz"] is None else f"{snap['rate_hz']:.2f} Hz"
+        lines = [f"loop rate {rate} over the last {len(self.starts)} iterations",
+                 f"{'stage':14s} {'p50 ms':>9s} {'p95 ms':>9s} {'max ms':>9s} {'count':>8s}"]
+        rows = list(snap["stages"].items()) + [("(loop)", snap["loop"])]
+        for name, s in rows:
+            cells = ["-" if s[k] is None else f"{s[k]:.3f}" for k in ("p50_ms", "p95_ms", "max_ms")]
+            lines.append(f"{name:14s} {cells[0]:>9s} {cells[1]:>9s} {cells[2]:>9s} {s['count']:8d}")
+        return "\n".join(lines)
+
+
+def serve_status(profiler, host="0.0.0.0", port=STATUS_PORT):
+    """Thread answering every TCP connection with profiler.report()."""
+    server = socket.create_server((host, port))
+
+    def run():
+        while True:
+            conn, _ = server.accept()
+            try:
+                conn.sendall((profiler.report() + "\n").encode())
+            except OSError:
+                pass
+            finally:
+                conn.close()
+
+    threading.Thread(target=run, daemon=True, name="loop-profiler-status").start()
+    print(f"Loop profile on tcp://{host}:{port}")
+    return server
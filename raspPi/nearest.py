@@ -0,0 +1,121 @@
+import math
+
+# ----------------------------
+# Nearest exhibit country
+# ----------------------------
+# For points outside every outline (oceans, gaps around tiny countries) the
+# nearest exhibit country within MAX_DISTANCE degrees is used instead.
+#
+# A 3-d KD-tree holds unit vectors of every outline vertex plus one centroid
+# per polygon. On the unit sphere the straight-line (chord) distance grows
+# with the angle, so the nearest point by chord is also the nearest by angle:
+#   angle = 2 * asin(chord / 2)
+
+MAX_DISTANCE = 5.0  # degrees
+
+
+def to_unit(lat, lon):
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+def chord_to_degrees(chord):
+    return math.degrees(2 * math.asin(min(1.0, chord / 2)))
+
+
+def degrees_to_chord(degrees):
+    return 2 * math.sin(math.radians(degrees) / 2)
+
+
+class KDTree:
+    """
+    Static 3-d tree. Nodes are (point, value, axis, left, right) tuples,
+    built by median split on x, y, z in turn.
+    """
+
+    def __init__(self, points, values):
+        items = list(zip(points, values))
+        self.size = len(items)
+        self.root = self._build(items, 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        mid = len(items) // 2
+        point, value = items[mid]
+        return (
+            point, value, axis,
+            self._build(items[:mid], depth + 1),
+            self._build(items[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, target, max_dist=math.inf):
+        """(value, distance) of the closest point within max_dist, or (None, None)."""
+        best_value = None
+        best_d2 = max_dist * max_dist
+        tx, ty, tz = target
+        # (node, squared distance from target to the node's region bound)
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or bound >= best_d2:
+                continue
+            (px, py, pz), value, axis, left, right = node
+            d2 = (px - tx) ** 2 + (py - ty) ** 2 + (pz - tz) ** 2
+            if d2 < best_d2:
+                best_d2 = d2
+                best_value = value
+            diff = target[axis] - node[0][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # the far side only helps if the splitting plane is closer than the best so far
+            stack.append((far, diff * diff))
+            stack.append((near, bound))
+        if best_value is None:
+            return None, None
+        return best_value, math.sqrt(best_d2)
+
+
+class NearestCountry:
+    def __init__(self, geocoder):
+        self.geocoder = geocoder
+        points, ids = [], []
+        for polygon in geocoder.polygons:
+            xs, ys = polygon.rings[0]
+            for lon, lat in zip(xs, ys):
+                points.append(to_unit(lat, lon))
+                ids.append(polygon.country_id)
+            # centroid of the outline's vertices, good enough for small islands
+            points.append(to_unit(sum(ys) / len(ys), sum(xs) / len(xs)))
+            ids.append(polygon.country_id)
+        self.tree = KDTree(points, ids)
+
+    def nearest_id(self, lat, lon, max_degrees=MAX_DISTANCE):
+        """(country id, degrees) of the closest exhibit country, or (None, None)."""
+        country_id, chord = self.tree.nearest(to_unit(lat, lon), degrees_to_chord(max_degrees))
+        if country_id is None:
+            return None, None
+        return country_id, chord_to_degrees(chord)
+
+    def nearest(self, lat, lon, max_degrees=MAX_DISTANCE):
+        country_id, degrees = self.nearest_id(lat, lon, max_degrees)
+        if country_id is None:
+            return None, None
+        return self.geocoder.countries[country_id], degrees
+
+    def resolve(self, lat, lon, max_degrees=MAX_DISTANCE):
+        """
+        {"id", "country", "distance", "match"} where match is "in" for a
+        point inside the country, "near" for the fallback and None when
+        nothing is within max_degrees.
+        """
+        country_id = self.geocoder.lookup_id(lat, lon)
+        if country_id is not None:
+            return {"id": country_id, "country": self.geocoder.countries[country_id],
+                    "distance": 0.0, "match": "in"}
+        country_id, degrees = self.nearest_id(lat, lon, max_degrees)
+        if country_id is None:
+            return {"id": None, "country": None, "distance": None, "match": None}
+        return {"id": country_id, "country": self.geocoder.countries[country_id],
+                "distance": round(degrees, 3), "match": "near"}
@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+from geocoder import API_DIR, COUNTRIES_PATH
+
+# ----------------------------
+# Quiz bank compiler
+# ----------------------------
+# Offline:  python quizbank.py            (writes QUIZ_BANK_PATH)
+#           python quizbank.py Norway     (prints one country's quiz)
+#
+# Multiple-choice questions per country, in the shape QuizPage expects:
+#   {"question": ..., "answers": [{"answer": ..., "correct": true}, ...]}
+# made from the structured fields of countries.json and inventions.json
+# (capital, national animal, dishes, exports, inventors, years). Wrong
+# answers are taken from the other countries, leaving out inventions that
+# share a name word with the one asked about ("Paper" is not a wrong answer
+# for "Paper (Papyrus)"). Countries with fewer than MIN_QUIZ_LENGTH
+# questions are topped up with generic invention questions, and left out
+# of the bank if that is still not enough.
+#
+# Every country gets its own seeded RNG, so the same data always compiles
+# to the same bank. The bank records a hash of the files it was built from;
+# ContentStore compiles a fresh one in memory when that doesn't match.
+
+QUIZ_BANK_PATH = os.path.join(API_DIR, "quiz_bank.json")
+INVENTIONS_PATH = os.path.join(API_DIR, "inventions.json")
+
+BANK_FORMAT = 3  # bump when the compiler changes, older banks are rebuilt
+QUIZ_LENGTH = 10    # questions per country at most
+MIN_QUIZ_LENGTH = 4  # fewer than this and the country gets no quiz
+ANSWER_COUNT = 4    # QuizPage labels them A-D
+MIN_YEAR_GAP = 5    # wrong years at least this far from the right one
+
+
+def source_digest(countries_raw, inventions_raw):
+    return hashlib.sha1(countries_raw + b"\0" + inventions_raw).hexdigest()
+
+
+def _question(rng, text, correct, pool):
+    """One question with ANSWER_COUNT - 1 wrong answers from pool, or None."""
+    taken = {correct.casefold()}
+    wrong = []
+    for answer in pool:
+        if answer.casefold() not in taken:
+            taken.add(answer.casefold())
+            wrong.append(answer)
+    if len(wrong) < ANSWER_COUNT - 1:
+        return None
+    answers = [{"answer": correct, "correct": True}]
+    answers += [{"answer": a, "correct": False} for a in rng.sample(wrong, ANSWER_COUNT - 1)]
+    rng.shuffle(answers)
+    return {"question": text, "answers": answers}
+
+
+def _others(values_by_country, country):
+    """Values of every country except this one, in a stable order."""
+    return [v for other, values in values_by_country.items() if other != country for v in values]
+
+
+def _invention(name):
+    # "The Kora" -> "Kora", so "Who invented the Kora?" reads right
+    return name[4:] if name.startswith("The ") else name
+
+
+# words that don't make two inventions, dishes or exports the same thing
+GENERIC_WORDS = {"the", "and", "for", "from", "early", "first", "modern", "practical",
+                 "traditional", "prototype", "system", "machine", "device",
+                 "with", "con", "del", "products", "goods"}
+
+
+def name_words(name):
+    """Significant words of an invention, dish or export, e.g. {"paper", "papyrus"}."""
+    return {w for w in re.findall(r"[^\W\d_]+", name.casefold()) if len(w) > 2 and w not in GENERIC_WORDS}
+
+
+def _unrelated(pairs, words):
+    """Values of (value, name words) pairs whose name shares no word with words."""
+    return [value for value, other in pairs if not other & words]
+
+
+def _year_question(rng, name, year, years_by_country, country):
+    # the closest years from other countries make the best wrong answers
+    pool = _unrelated(_others(years_by_country, country), name_words(name))
+    candidates = sorted(
+        {y for y in pool if abs(int(y) - int(year)) >= MIN_YEAR_GAP},
+        key=lambda y: (abs(int(y) - int(year)), y),
+    )
+    return _question(rng, f"In which year was the {_invention(name)} invented?", year,
+                     candidates[:ANSWER_COUNT - 1])
+
+
+def _generic_questions(rng, country, names_by_country, count):
+    """Up to count questions that only need the country's invention names."""
+    own = names_by_country.get(country, [])
+    own_words = set().union(*(words for _, words in own))
+    # countries with a similar invention can't be the wrong answer to "where is it from"
+    unrelated = [c for c, pairs in names_by_country.items()
+                 if c != country and not any(words & own_words for _, words in pairs)]
+    questions = []
+    if own:
+        name = rng.choice(own)[0]
+        questions.append(_question(rng, f"Which of these was invented in {country}?", name,
+                                   _unrelated(_others(names_by_country, country), own_words)))
+    for name, _ in own:
+        questions.append(_question(rng, f"Where was the {_invention(name)} invented?", country, unrelated))
+    return [q for q in questions if q is not None][:count]
+
+
+def compile_bank(countries, inventions, quiz_length=QUIZ_LENGTH):
+    """{case-folded country: {"country", "questions"}} for both data lists."""
+    about = {}
+    for item in countries:
+        about.setdefault(item["country"], item)
+    invented = {}
+    for item in inventions:
+        invented.setdefault(item["country"], item.get("inventions", []))
+
+    def field(key):
+        return {c: [item[key]] for c, item in about.items() if item.get(key)}
+
+    def list_field(key):
+        return {c: list(item.get(key) or []) for c, item in about.items()}
+
+    capitals = field("capital")
+    animals = field("national_animal")
+    # "Crude petroleum" is no wrong answer when "Crude oil" is right
+    dishes = {c: [(d, name_words(d)) for d in values] for c, values in list_field("popular_dishes").items()}
+    exports = {c: [(e, name_words(e)) for e in values] for c, values in list_field("exports").items()}
+    inventors = {c: [(i["inventor"], name_words(i["name"])) for i in items if i.get("inventor")]
+                 for c, items in invented.items()}
+    years = {c: [(i["year"], name_words(i["name"])) for i in items if str(i.get("year", "")).isdigit()]
+             for c, items in invented.items()}
+    names = {c: [(i["name"], name_words(i["name"])) for i in items] for c, items in invented.items()}
+
+    bank = {}
+    for country in list(about) + [c for c in invented if c not in about]:
+        rng = random.Random(country)
+        questions = []
+        item = about.get(country)
+        if item is not None:
+            if item.get("capital"):
+                questions.append(_question(rng, f"What is the capital of {country}?",
+                                           item["capital"], _others(capitals, country)))
+            if item.get("national_animal"):
+                questions.append(_question(rng, f"What is the national animal of {country}?",
+                                           item["national_animal"], _others(animals, country)))
+            if dishes.get(country):
+                own_words = set().union(*(words for _, words in dishes[country]))
+                questions.append(_question(rng, f"Which of these dishes comes from {country}?",
+                                           rng.choice(dishes[country])[0],
+                                           _unrelated(_others(dishes, country), own_words)))
+            if exports.get(country):
+                own_words = set().union(*(words for _, words in exports[country]))
+                questions.append(_question(rng, f"Which of these is one of {country}'s main exports?",
+                                           rng.choice(exports[country])[0],
+                                           _unrelated(_others(exports, country), own_words)))
+        for invention in invented.get(country, []):
+            if invention.get("inventor"):
+                questions.append(_question(rng, f"Who invented the {_invention(invention['name'])}?",
+                                           invention["inventor"],
+                                           _unrelated(_others(inventors, country), name_words(invention["name"]))))
+            if str(invention.get("year", "")).isdigit():
+                questions.append(_year_question(rng, invention["name"], invention["year"],
+                                                years, country))
+
+        questions = [q for q in questions if q is not None]
+        if len(questions) < MIN_QUIZ_LENGTH:
+            questions += _generic_questions(rng, country, names, MIN_QUIZ_LENGTH - len(questions))
+        if len(questions) < MIN_QUIZ_LENGTH:
+            continue
+        if len(questions) > quiz_length:
+            # keep the original order, so related questions stay together
+            keep = sorted(rng.sample(range(len(questions)), quiz_length))
+            questions = [questions[i] for i in keep]
+        bank[country.casefold()] = {"country": country, "questions": questions}
+    return bank
+
+
+def build(countries_path=COUNTRIES_PATH, inventions_path=INVENTIONS_PATH):
+    with open(countries_path, "rb") as f:
+        countries_raw = f.read()
+    with open(inventions_path, "rb") as f:
+        inventions_raw = f.read()
+    return {
+        "format": BANK_FORMAT,
+        "source_sha1": source_digest(countries_raw, inventions_raw),
+        "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "countries": compile_bank(json.loads(countries_raw), json.loads(inventions_raw)),
+    }
+
+
+def write(path, bank):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(bank, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load(path, digest):
+    """Countries of the bank at path, or None if it's missing or out of date."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            bank = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if bank.get("format") != BANK_FORMAT or bank.get("source_sha1") != digest:
+        return None
+    return bank["countries"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the quiz bank")
+    parser.add_argument("country", nargs="?", help="print this country's quiz instead")
+    parser.add_argument("--out", default=QUIZ_BANK_PATH)
+    args = parser.parse_args()
+
+    started = time.time()
+    bank = build()
+    if args.country:
+        print(json.dumps(bank["countries"].get(args.country.casefold()), ensure_ascii=False, indent=2))
+    else:
+        write(args.out, bank)
+        count = sum(len(c["questions"]) for c in bank["countries"].values())
+        print(f"Wrote {args.out}: {count} questions for {len(bank['countries'])} countries, "
+              f"{time.time() - started:.2f}s")
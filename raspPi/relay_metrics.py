@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import deque
+
+from tracing import Histogram
+
+# ----------------------------
+# Relay metrics
+# ----------------------------
+# Counters, gauges and latency histograms kept in memory and served as
+# plain text (Prometheus exposition format) on a side HTTP port:
+#
+#   curl http://relay-host:9100/metrics
+#
+# Gauges are callables evaluated when the page is rendered, so reading
+# queue depths or session counts costs nothing on the message path.
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+class RateMeter:
+    """Events per second per key over the last `window` seconds."""
+
+    def __init__(self, window=10):
+        self.window = window
+        self.buckets = {}  # key -> deque of [second, count]
+
+    def mark(self, key, now=None):
+        sec = int(time.time() if now is None else now)
+        buckets = self.buckets.get(key)
+        if buckets is None:
+            buckets = self.buckets[key] = deque()
+        if buckets and buckets[-1][0] == sec:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([sec, 1])
+            while buckets and buckets[0][0] <= sec - self.window:
+                buckets.popleft()
+
+    def rates(self, now=None):
+        cutoff = int(time.time() if now is None else now) - self.window
+        result = {}
+        for key, buckets in self.buckets.items():
+            total = sum(count for sec, count in buckets if sec > cutoff)
+            result[key] = total / self.window
+        return result
+
+
+class Metrics:
+    def __init__(self, prefix="relay"):
+        self.prefix = prefix
+        self.started_at = time.time()
+        self.counters = {}    # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: Histogram}
+        self.gauges = {}      # name -> callable returning a number or {labels: number}
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, n=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + n
+
+    def observe(self, name, value, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = Histogram()
+        hist.observe(value)
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def render(self):
+        lines = []
+
+        def header(name, kind):
+            full = f"{self.prefix}_{name}"
+            if name in self.help:
+                lines.append(f"# HELP {full} {self.help[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        full = header("uptime_seconds", "gauge")
+        lines.append(f"{full} {time.time() - self.started_at:.3f}")
+
+        for name, series in sorted(self.counters.items()):
+            full = header(name, "counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{full}{_label_str(labels)} {value}")
+
+        for name, fn in sorted(self.gauges.items()):
+            full = header(name, "gauge")
+            value = fn()
+            if isinstance(value, dict):
+                for labels, v in sorted(value.items()):
+                    lines.append(f"{full}{_label_str(labels)} {v}")
+            else:
+                lines.append(f"{full} {value}")
+
+        for name, series in sorted(self.histograms.items()):
+            full = header(name, "histogram")
+            for labels, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(hist.buckets + ["+Inf"], hist.counts):
+                    cumulative += count
+                    le = labels + (("le", bound),)
+                    lines.append(f"{full}_bucket{_label_str(le)} {cumulative}")
+                lines.append(f"{full}_sum{_label_str(labels)} {hist.total}")
+                lines.append(f"{full}_count{_label_str(labels)} {hist.count}")
+
+            # p50/p95/p99 over the recent window, as their own gauge family
+            full = header(f"{name}_recent", "gauge")
+            for labels, hist in sorted(series.items()):
+                for p in (50, 95, 99):
+                    value = hist.percentile(p)
+                    if value is not None:
+                        q = labels + (("quantile", p / 100),)
+                        lines.append(f"{full}{_label_str(q)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(metrics, host, port, on_post=None):
+    """
+    Minimal HTTP server answering every GET with metrics.render().
+    POSTs go to on_post(path, body) when given, which returns True if it
+    took them.
+    """
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value.strip() or 0)
+            method, _, rest = request.partition(b" ")
+            if method == b"GET":
+                body = metrics.render().encode()
+                status = b"200 OK"
+            elif method == b"POST" and on_post is not None:
+                path = rest.split(b" ")[0].decode("latin-1")
+                if on_post(path, await reader.readexactly(length)):
+                    body = b"ok\n"
+                    status = b"200 OK"
+                else:
+                    body = b"not found\n"
+                    status = b"404 Not Found"
+            else:
+                body = b"method not allowed\n"
+                status = b"405 Method Not Allowed"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
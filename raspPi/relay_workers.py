@@ -0,0 +1,89 @@
+import asyncio
+import multiprocessing
+import threading
+import zlib
+
+# ----------------------------
+# Multi-process relay support
+# ----------------------------
+# run_workers() starts N processes that each run their own event loop and
+# bind the same port with SO_REUSEPORT, so the kernel spreads connections
+# over them. The workers share one inbox queue per worker, for cross-worker
+# fan-out and for handing a globe's samples to the worker that owns it.
+#
+# A globe always has the same owner worker (crc32 of its device id), no
+# matter which worker the kernel gave its connection to, so per-globe state
+# like dwell detection stays in one place.
+
+
+def owner_of(device, count):
+    return zlib.crc32(str(device).encode()) % count
+
+
+class WorkerContext:
+    def __init__(self, index, count, inboxes):
+        self.index = index
+        self.count = count
+        self.inboxes = inboxes
+
+    def owner_of(self, device):
+        return owner_of(device, self.count)
+
+    def owns(self, device):
+        return self.owner_of(device) == self.index
+
+    def send_to(self, worker, item):
+        self.inboxes[worker].put(item)
+
+    def publish(self, item):
+        """Send an item to every other worker."""
+        for i, inbox in enumerate(self.inboxes):
+            if i != self.index:
+                inbox.put(item)
+
+    def start_inbox(self, handler):
+        """
+        Call handler(item) on this worker's event loop for every item put in
+        its inbox. Must be called from inside the running loop.
+        """
+        loop = asyncio.get_running_loop()
+        inbox = self.inboxes[self.index]
+
+        def pump():
+            while True:
+                item = inbox.get()
+                if item is None:
+                    break
+                loop.call_soon_threadsafe(handler, item)
+
+        threading.Thread(target=pump, name=f"relay-inbox-{self.index}", daemon=True).start()
+
+
+def _worker_main(serve, ctx):
+    try:
+        asyncio.run(serve(ctx))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(serve, count):
+    """
+    Start `count` processes running the coroutine serve(ctx) and wait for
+    them. serve must bind its sockets with reuse_port=True.
+    """
+    inboxes = [multiprocessing.Queue() for _ in range(count)]
+
+    workers = []
+    for i in range(count):
+        ctx = WorkerContext(i, count, inboxes)
+        p = multiprocessing.Process(target=_worker_main, args=(serve, ctx), name=f"relay-worker-{i}")
+        p.start()
+        workers.append(p)
+    print(f"Started {count} relay workers")
+
+    try:
+        for p in workers:
+            p.join()
+    except KeyboardInterrupt:
+        for p in workers:
+            p.join()
@@ -1,25 +1,155 @@
+import queue
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
 
 #send latitude and longitude to the server
 
-def send_coords(lat, lon, token):
-    url = "http://www.example.com"
-    payload = {
-        "lat": lat, 
-        "lon": lon,
-        "token": token
+COORDS_URL = "http://www.example.com/api/coordinates"
+
+# batching configs
+BATCH_SIZE = 20         # flush when this many points are waiting
+FLUSH_INTERVAL = 0.5    # seconds, flush whatever is waiting after this long
+MAX_QUEUED = 1000       # points kept while the server is unreachable
+REQUEST_TIMEOUT = 5
+RETRY_INTERVAL = 2      # seconds between attempts at a batch that failed
+
+
+class CoordsClient:
+    """
+    Queues points from the sampling loop and posts them in batches from a
+    background thread over one keep-alive session.
+
+    send() never blocks: if the queue is full the oldest point is dropped,
+    since a newer position is worth more than an old one.
+
+    A batch that fails is retried every RETRY_INTERVAL until it goes
+    through; meanwhile new points wait in the queue (up to max_queued).
+    """
+
+    def __init__(self, url=COORDS_URL, token=None, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_queued=MAX_QUEUED):
+        self.url = url
+        self.token = token
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.lock = threading.Lock()
+        self.stats = {
+            "queued": 0,
+            "sent": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "failed_points": 0,
+            "dropped": 0,
         }
+        self.started_at = time.time()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="coords-client", daemon=True)
+        self._thread.start()
 
-    try:
-        #send request
-        response = requests.post(url, json=payload, timeout=5)
-        
-        #if response is not ok
-        response.raise_for_status()
-        
+    def send(self, lat, lon, **extra):
+        point = {"lat": lat, "lon": lon, "t": time.time()}
+        point.update(extra)
+        while True:
+            try:
+                self.queue.put_nowait(point)
+                break
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self._count("dropped")
+                except queue.Empty:
+                    pass
+        self._count("queued")
 
-        return response.json()
-    except requests.RequestException as e:
-        print("Error sending coordinates:", e)
-        return None
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
 
+    def _take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _post(self, batch):
+        payload = {"points": batch, "token": self.token}
+        try:
+            response = self.session.post(self.url, json=payload, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print("Error sending coordinates:", e)
+            self._count("failed_batches")
+            return False
+        self._count("batches")
+        self._count("sent", len(batch))
+        return True
+
+    def _run(self):
+        batch = []
+        while not self._stop.is_set():
+            if not batch:
+                batch = self._take_batch()
+            if not batch:
+                continue
+            if self._post(batch):
+                batch = []
+            else:
+                # keep the batch and try again, unless close() comes first
+                self._stop.wait(RETRY_INTERVAL)
+
+        # drain what was queued before close(), one attempt per batch
+        while True:
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            if not self._post(batch):
+                self._count("failed_points", len(batch))
+            batch = []
+
+    def report(self):
+        """Snapshot of the counters plus throughput since start."""
+        with self.lock:
+            stats = dict(self.stats)
+        elapsed = time.time() - self.started_at
+        stats["pending"] = self.queue.qsize()
+        stats["points_per_s"] = stats["sent"] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def close(self, timeout=REQUEST_TIMEOUT):
+        self._stop.set()
+        self._thread.join(timeout)
+        self.session.close()
+
+
+_clients = {}  # token -> CoordsClient
+_clients_lock = threading.Lock()
+
+
+def send_coords(lat, lon, token):
+    """Queue one point on the shared client for this token; returns immediately."""
+    with _clients_lock:
+        client = _clients.get(token)
+        if client is None:
+            client = _clients[token] = CoordsClient(token=token)
+    client.send(lat, lon)
@@ -0,0 +1,10 @@
+# ----------------------------
+# Stability check
+# ----------------------------
+# A globe counts as resting on a spot once its samples have stayed within
+# STABILITY_ROOM degrees of where they settled for STABILITY_TIME seconds.
+# listentest.py fires the Node-RED request on it and raspy's last-value
+# cache reports it to consumers, so both read it from here.
+
+STABILITY_ROOM = 3  # degrees
+STABILITY_TIME = 3  # seconds
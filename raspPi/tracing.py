@@ -0,0 +1,173 @@
+import bisect
+import json
+import os
+import time
+from collections import deque
+
+# ----------------------------
+# Trace helpers
+# ----------------------------
+# A trace rides along inside each coordinate message:
+#
+#   "trace": {
+#       "id": "9f2c0a1b7e4d3c21",
+#       "clock_offset": 0.0123,          # relay clock - Pi clock, seconds
+#       "hops": {"imu_start": ..., "imu_read": ..., "latlon": ..., "sent": ...}
+#   }
+#
+# Every hop is a time.time() stamp taken on the machine doing that step.
+# Pi stamps are moved onto the relay clock with clock_offset before any
+# cross-machine difference is taken.
+
+# order in which hops happen, used to turn stamps into per-hop durations
+HOP_ORDER = [
+    "imu_start",      # before the I2C read
+    "imu_read",       # quaternion read done
+    "latlon",         # vector -> lat/lon done
+    "sent",           # handed to the websocket / UDP socket
+    "relay_recv",     # relay got the message
+    "relay_done",     # relay finished handle_client work
+    "nodered_sent",   # POST to Node-RED started
+    "nodered_done",   # Node-RED answered
+    "socketio_emit",  # server.js emitted to the kiosk
+]
+
+# stamps taken on the Pi, everything else is on the relay / server
+PI_HOPS = {"imu_start", "imu_read", "latlon", "sent"}
+
+
+def new_trace():
+    return {"id": os.urandom(8).hex(), "hops": {}}
+
+
+def mark(trace, hop, t=None):
+    if trace is not None:
+        trace.setdefault("hops", {})[hop] = time.time() if t is None else t
+    return trace
+
+
+def hop_durations(trace):
+    """
+    Turn hop stamps into {"prev->hop": seconds} for consecutive hops that
+    are both present, with Pi stamps shifted onto the relay clock.
+    """
+    hops = trace.get("hops", {})
+    offset = trace.get("clock_offset") or 0.0
+    durations = {}
+    prev_name, prev_t = None, None
+    for name in HOP_ORDER:
+        t = hops.get(name)
+        if t is None:
+            continue
+        if name in PI_HOPS:
+            t += offset
+        if prev_name is not None:
+            durations[f"{prev_name}->{name}"] = t - prev_t
+        prev_name, prev_t = name, t
+    return durations
+
+
+# ----------------------------
+# Clock offset (NTP style)
+# ----------------------------
+class ClockOffset:
+    """
+    Estimate of (relay clock - local clock) from ping exchanges:
+      t0 local send, t1 relay receive, t2 relay reply, t3 local receive.
+    The sample with the smallest round trip in the window wins, since it
+    had the least queueing to skew it.
+    """
+
+    def __init__(self, window=16):
+        self.samples = deque(maxlen=window)
+
+    def add(self, t0, t1, t2, t3):
+        rtt = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        self.samples.append((rtt, offset))
+
+    @property
+    def offset(self):
+        if not self.samples:
+            return None
+        return min(self.samples)[1]
+
+    @property
+    def rtt(self):
+        if not self.samples:
+            return None
+        return min(self.samples)[0]
+
+
+# ----------------------------
+# Latency histograms
+# ----------------------------
+# bucket upper bounds in seconds, roughly log spaced from 0.1 ms to 10 s
+BUCKETS = [
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+]
+
+
+class Histogram:
+    """
+    Fixed-bucket counts for export plus a window of recent samples
+    for p50/p95/p99.
+    """
+
+    def __init__(self, buckets=BUCKETS, window=2048):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def percentile(self, p):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": max(self.recent) if self.recent else None,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class HopHistograms:
+    """One histogram per hop, filled from finished traces."""
+
+    def __init__(self):
+        self.hops = {}
+
+    def observe(self, hop, value):
+        hist = self.hops.get(hop)
+        if hist is None:
+            hist = self.hops[hop] = Histogram()
+        hist.observe(value)
+
+    def observe_trace(self, trace):
+        for hop, value in hop_durations(trace).items():
+            self.observe(hop, value)
+
+    def export(self):
+        return {hop: hist.summary() for hop, hist in sorted(self.hops.items())}
+
+    def write_json(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.export(), f, indent=2)
+        os.replace(tmp, path)
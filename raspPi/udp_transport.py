@@ -0,0 +1,114 @@
+import asyncio
+import json
+import socket
+import time
+
+# ----------------------------
+# UDP coordinate transport
+# ----------------------------
+# Pointer samples go out as one JSON datagram each. A lost datagram is never
+# resent and never holds back later ones: the relay only keeps the newest
+# sample per device and drops anything that arrives out of order.
+#
+# Datagram format:
+#   {"device": "globe-1", "session": 123456, "seq": 42, "lat": 59.9, "lon": 10.7}
+#
+# "session" is the sender's start time in milliseconds, so the relay can
+# tell a restarted sender (seq back to 1) apart from a stale packet: only a
+# newer session replaces the current one. A Pi without a clock may come
+# back with an older start time, so after SESSION_TIMEOUT seconds of
+# silence from a device any session is taken.
+
+SEQ_MODULUS = 2 ** 32
+SESSION_TIMEOUT = 5.0
+
+
+def seq_newer(seq, last):
+    """True if `seq` comes after `last`, allowing for wraparound."""
+    diff = (seq - last) % SEQ_MODULUS
+    return 0 < diff < SEQ_MODULUS // 2
+
+
+class UdpCoordSender:
+    def __init__(self, host, port, device_id):
+        self.addr = (host, port)
+        self.device_id = device_id
+        self.session = time.time_ns() // 1_000_000
+        self.seq = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def send(self, lat, lon, **extra):
+        self.seq = (self.seq + 1) % SEQ_MODULUS
+        msg = {
+            "device": self.device_id,
+            "session": self.session,
+            "seq": self.seq,
+            "lat": lat,
+            "lon": lon,
+        }
+        msg.update(extra)
+        try:
+            self.sock.sendto(json.dumps(msg, separators=(",", ":")).encode(), self.addr)
+        except (BlockingIOError, OSError) as e:
+            # the next sample supersedes this one anyway
+            print("UDP send dropped:", e)
+        return msg
+
+    def close(self):
+        self.sock.close()
+
+
+class UdpCoordProtocol(asyncio.DatagramProtocol):
+    """
+    Receives coordinate datagrams and calls on_coords(data, addr, device)
+    for every sample that is newer than the last one seen from the same
+    device. device is data["device"], or ip:port for senders without one;
+    data itself is passed on as it arrived.
+    """
+
+    def __init__(self, on_coords):
+        self.on_coords = on_coords
+        self.last_seen = {}  # device -> (session, seq, monotonic time received)
+        self.received = 0
+        self.dropped_stale = 0
+        self.dropped_invalid = 0
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            self.dropped_invalid += 1
+            print("Invalid datagram from", addr)
+            return
+        if not isinstance(msg, dict):
+            self.dropped_invalid += 1
+            return
+
+        device = msg.get("device") or f"{addr[0]}:{addr[1]}"
+        session = msg.get("session")
+        seq = msg.get("seq")
+
+        if isinstance(seq, int):
+            now = time.monotonic()
+            last = self.last_seen.get(device)
+            if last is not None and not self._accept(last, session, seq, now):
+                self.dropped_stale += 1
+                return
+            self.last_seen[device] = (session, seq, now)
+
+        self.on_coords(msg, addr, device)
+
+    @staticmethod
+    def _accept(last, session, seq, now):
+        last_session, last_seq, received = last
+        if session == last_session:
+            return seq_newer(seq, last_seq)
+        if now - received > SESSION_TIMEOUT:
+            return True
+        # a late packet from the previous run must not take over again
+        return isinstance(session, int) and isinstance(last_session, int) and session > last_session
+
+    def error_received(self, exc):
+        print("UDP error:", exc)
@@ -0,0 +1,266 @@
+import argparse
+import inspect
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+import timeit
+
+import kernels
+
+# ----------------------------
+# Orientation math benchmarks
+# ----------------------------
+# Times the quaternion helpers and lat/lon conversions of the sensor
+# scripts, loaded without the hardware (see kernels.py), on plain Linux.
+#
+#   python bench_math.py --json bench.json
+#   python bench_math.py --compare bench.json      (against an earlier run)
+#
+# scalar: the same input over and over, the cost of one call
+# batch:  BATCH_SIZE different fixed random inputs, per-sample cost
+# budget: batch cost as a share of one sample period at SAMPLE_RATE
+#
+# "<script>.pipeline" is all the math one main-loop iteration of that script
+# does per sample, without the I2C read, printing and sending.
+
+SCRIPTS = {
+    "gustav3": ("raspy/gustav3.py", ()),
+    "testx": ("raspy/testx.py", ()),
+    "globe_offset2": ("raspy/globe_offset2.py", ()),
+    "globe": ("raspPi/globe.py", ("quat_from_axis_angle",)),
+}
+
+# argument kinds per kernel; None means "look at the signature":
+# one vector, or (forward, up) as in testx
+KERNELS = {
+    "quat_mul": ("quat", "quat"),
+    "rotate_vector_by_quat": ("vec", "quat"),
+    "rotate_vector": ("quat", "vec"),
+    "quat_from_two_vectors": ("unit", "unit"),
+    "vector_to_latlon": None,
+    "vectors_to_lat_lon": ("unit", "unit"),
+}
+
+SAMPLE_RATE = 100      # Hz a Pi Zero should keep up with
+BATCH_SIZE = 10000
+REPEAT = 5
+
+
+# ----------------------------
+# Inputs
+# ----------------------------
+def random_unit(rng):
+    while True:
+        v = (rng.gauss(0, 1), rng.gauss(0, 1), rng.gauss(0, 1))
+        n = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+        if n > 1e-9:
+            return (v[0] / n, v[1] / n, v[2] / n)
+
+
+def random_quat(rng):
+    """Uniformly random unit quaternion, (x, y, z, w)."""
+    u1, u2, u3 = rng.random(), rng.random(), rng.random()
+    a, b = math.sqrt(1 - u1), math.sqrt(u1)
+    return (a * math.sin(2 * math.pi * u2), a * math.cos(2 * math.pi * u2),
+            b * math.sin(2 * math.pi * u3), b * math.cos(2 * math.pi * u3))
+
+
+def make_inputs(rng, kinds, count):
+    makers = {
+        "quat": random_quat,
+        "unit": random_unit,
+        # sensor vectors aren't normalised
+        "vec": lambda r: tuple(c * r.uniform(0.5, 2.0) for c in random_unit(r)),
+    }
+    return [tuple(makers[kind](rng) for kind in kinds) for _ in range(count)]
+
+
+def kernel_kinds(name, fn):
+    kinds = KERNELS[name]
+    if kinds is not None:
+        return kinds
+    required = [p for p in inspect.signature(fn).parameters.values() if p.default is p.empty]
+    return ("vec",) if len(required) == 1 else ("unit", "unit")
+
+
+# ----------------------------
+# Main-loop math per script
+# ----------------------------
+def pipelines(modules):
+    """{script: (function(q, accel), kinds)} with each script's per-sample math."""
+    found = {}
+    identity = (0.0, 0.0, 0.0, 1.0)
+
+    m = modules.get("gustav3")
+    if m is not None:
+        def gustav3(q, accel, m=m):
+            raw_q = m.quat_norm(q)
+            world_vec = m.rotate_vector_by_quat(m.sensor_axis, raw_q)
+            world_vec = m.rotate_vector_by_quat(world_vec, m.calibration_quat)
+            return m.vector_to_latlon(world_vec)
+        found["gustav3"] = gustav3
+
+    m = modules.get("testx")
+    if m is not None:
+        def testx(q, accel, m=m):
+            quat = m.quat_norm(q)
+            corrected_q = m.quat_norm(m.quat_mul(m.calibration_quat or identity, quat))
+            world_forward = m.rotate_vector_by_quat(m.sensor_forward, corrected_q)
+            world_up = m.normalize(accel)
+            return m.vector_to_latlon(world_forward, world_up)
+        found["testx"] = testx
+
+    m = modules.get("globe_offset2")
+    if m is not None:
+        def globe_offset2(q, accel, m=m):
+            corrected_q = m.quat_mul(m.calibration_quat, q)
+            world_vec = m.rotate_vector_by_quat(m.sensor_axis, corrected_q)
+            return m.vector_to_latlon(world_vec)
+        found["globe_offset2"] = globe_offset2
+
+    m = modules.get("globe")
+    if m is not None:
+        def globe(q, accel, m=m):
+            corrected_q = m.quat_mul(m.calibration_quat, q)
+            up_tilted = m.rotate_vector(m.TILT_QUAT, m.UP_VEC)
+            forward_tilted = m.rotate_vector(m.TILT_QUAT, m.FORWARD_VEC)
+            up_world = m.rotate_vector(corrected_q, up_tilted)
+            forward_world = m.rotate_vector(corrected_q, forward_tilted)
+            return m.vectors_to_lat_lon(up_world, forward_world)
+        found["globe"] = globe
+
+    return {script: (fn, ("quat", "vec")) for script, fn in found.items()}
+
+
+# ----------------------------
+# Timing
+# ----------------------------
+def _call(arity):
+    args = ", ".join(f"a{i}" for i in range(arity))
+    return f"fn({args})", args
+
+
+def time_scalar(fn, args, repeat):
+    """ns per call, repeating one input."""
+    stmt, _ = _call(len(args))
+    names = {"fn": fn, **{f"a{i}": a for i, a in enumerate(args)}}
+    timer = timeit.Timer(stmt, globals=names)
+    number, _ = timer.autorange()
+    return [t / number * 1e9 for t in timer.repeat(repeat, number)]
+
+
+def time_batch(fn, inputs, repeat):
+    """ns per sample over a list of different inputs."""
+    stmt, args = _call(len(inputs[0]))
+    timer = timeit.Timer(f"for {args}, in inputs: {stmt}", globals={"fn": fn, "inputs": inputs})
+    return [t / len(inputs) * 1e9 for t in timer.repeat(repeat, 1)]
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    return {"min": round(ordered[0], 1), "median": round(ordered[len(ordered) // 2], 1)}
+
+
+def run(args):
+    modules = {script: kernels.load(path, pure) for script, (path, pure) in SCRIPTS.items()}
+
+    cases = []
+    for script, module in modules.items():
+        for name in KERNELS:
+            fn = getattr(module, name, None)
+            if fn is not None:
+                cases.append((f"{script}.{name}", fn, kernel_kinds(name, fn)))
+    for script, (fn, kinds) in pipelines(modules).items():
+        cases.append((f"{script}.pipeline", fn, kinds))
+
+    if args.only:
+        cases = [case for case in cases if any(part in case[0] for part in args.only)]
+
+    period_ns = 1e9 / SAMPLE_RATE
+    results = {}
+    for name, fn, kinds in cases:
+        # the same inputs for the same seed, whatever else is selected
+        rng = random.Random(f"{args.seed}:{name}")
+        inputs = make_inputs(rng, kinds, args.batch)
+        scalar = summary(time_scalar(fn, inputs[0], args.repeat))
+        batch = summary(time_batch(fn, inputs, args.repeat))
+        results[name] = {
+            "scalar_ns": scalar,
+            "batch_ns": batch,
+            "budget_pct": round(100 * batch["median"] / period_ns, 4),
+        }
+        print(f"{name:40s} scalar {scalar['median']:9.1f} ns   batch {batch['median']:9.1f} ns/sample"
+              f"   {results[name]['budget_pct']:7.3f}% of {SAMPLE_RATE} Hz")
+    return results
+
+
+# ----------------------------
+# Output
+# ----------------------------
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=kernels.REPO_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path, tolerance):
+    with open(path, encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\nAgainst {path} ({old['meta'].get('commit')}), batch median, new/old:")
+    for name, result in results.items():
+        before = old["results"].get(name)
+        if before is None:
+            print(f"{name:40s} new")
+            continue
+        ratio = result["batch_ns"]["median"] / before["batch_ns"]["median"]
+        flag = "  slower" if ratio > 1 + tolerance else ""
+        print(f"{name:40s} {ratio:6.2f}x{flag}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks for the orientation math")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="inputs per batch run")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="run cases whose name contains one of these")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="slowdown flagged in --compare")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    started = time.time()
+    results = run(args)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "batch": args.batch,
+            "repeat": args.repeat,
+            "sample_rate": SAMPLE_RATE,
+            "seconds": round(time.time() - started, 1),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+    if args.compare:
+        compare(results, args.compare, args.tolerance)
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from collections import deque
+
+import websockets
+
+# ----------------------------
+# Per-subscriber send queues
+# ----------------------------
+# The broadcast path serialises a message once and push()es the same string
+# to every subscriber. push() never awaits: each subscriber has its own
+# writer task, so a slow kiosk only backs up its own queue.
+
+QUEUE_SIZE = 64
+
+# what to do when a subscriber's queue is full
+DROP_OLDEST = "drop_oldest"   # lose the oldest queued message, keep the newest
+DISCONNECT = "disconnect"     # close the connection, the client can reconnect
+
+
+class Subscriber:
+    def __init__(self, websocket, maxsize=QUEUE_SIZE, policy=DROP_OLDEST, on_sent=None):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_sent = on_sent  # called with seconds from push() to send done
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.task = asyncio.create_task(self._writer())
+        self.close_task = None
+
+    def push(self, data):
+        """Queue a pre-serialised message. Returns False if it was not queued."""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                print(f"Subscriber too slow, disconnecting: {self.websocket.remote_address}")
+                # 1013 "try again later"
+                self.close(1013, "subscriber too slow")
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append((time.monotonic(), data))
+        self.ready.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                if not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                queued_at, data = self.queue.popleft()
+                await self.websocket.send(data)
+                self.sent += 1
+                if self.on_sent is not None:
+                    self.on_sent(time.monotonic() - queued_at)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.closed = True
+
+    def close(self, code=1000, reason=""):
+        """Stop the writer and close the connection; a no-op once closed."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.task.cancel()
+        self.close_task = asyncio.create_task(self.websocket.close(code=code, reason=reason))
+
+
+def broadcast(subscribers, data, skip=None):
+    """Push one serialised message to every subscriber except `skip`."""
+    delivered = 0
+    for sub in subscribers:
+        if sub.websocket is skip:
+            continue
+        if sub.push(data):
+            delivered += 1
+    return delivered
@@ -10,6 +10,8 @@ import select
 from adafruit_bno08x.i2c import BNO08X_I2C
 from adafruit_bno08x import BNO_REPORT_ROTATION_VECTOR
 
+from loop_profiler import LoopProfiler, serve_status
+
 # ----------------------------
 # RESET PIN
 # ----------------------------
@@ -204,6 +206,15 @@ def calibrate(q_current):
     print("\n🎯 Full 3D calibration complete — this direction is now (0°,0°)\n")
 
 
+# ----------------------------
+# Loop profiler
+# ----------------------------
+# 'p' prints per-stage timings of the main loop, see loop_profiler.py
+PROFILE_ENABLED = True
+PROFILE_STATUS_PORT = None  # e.g. 9101 to serve them over TCP as well
+profiler = LoopProfiler(enabled=PROFILE_ENABLED)
+
+
 # ----------------------------
 # Keyboard Helper
 # ----------------------------
@@ -217,16 +228,23 @@ def key_pressed():
 # ----------------------------
 def main_loop():
     global sensor
-    print("Running. Press 'c' to calibrate (OPTION A: current direction -> 0°,0°).")
+    print("Running. Press 'c' to calibrate (OPTION A: current direction -> 0°,0°), 'p' for loop timings.")
+    if PROFILE_ENABLED and PROFILE_STATUS_PORT:
+        serve_status(profiler, port=PROFILE_STATUS_PORT)
 
     while True:
+        profiler.start()
         if key_pressed():
             ch = sys.stdin.read(1)
             if ch.lower() == "c":
                 calibrate(sensor.quaternion)
+            elif ch.lower() == "p":
+                print(profiler.report())
+        profiler.stage("keys")
 
         try:
             x, y, z, w = sensor.quaternion
+            profiler.stage("imu_read")
 
             if (x, y, z, w) == (0, 0, 0, 0):
                 time.sleep(0.01)
@@ -248,13 +266,16 @@ def main_loop():
             # print("IMU_VEC:", world_vec_imu, "GLOBE_VEC:", world_vec_globe)
 
             lat, lon = vector_to_latlon(world_vec_globe)
+            profiler.stage("math")
             if lat is None:
                 time.sleep(0.01)
                 continue
 
             print(f"lat: {lat:.3f}, lon: {lon:.3f}")
+            profiler.stage("print")
 
             time.sleep(0.1)
+            profiler.stage("sleep")
 
         except OSError:
             print("\n⚠️ I2C error — resetting sensor…")
@@ -0,0 +1,71 @@
+import ast
+import os
+import types
+
+# ----------------------------
+# Orientation math without the hardware
+# ----------------------------
+# The sensor scripts open I2C and reset the BNO08x at import time, so they
+# can't be imported on a laptop. load() parses a script and runs only:
+#   - its function definitions
+#   - "import math" style imports of the modules in STDLIB
+#   - assignments made of literals, names loaded so far, math.* calls and
+#     calls to the functions listed in `pure`
+# so e.g. globe.py's TILT_QUAT is there, but `sensor = init_sensor()` is not.
+# The functions are the scripts' own code, not copies.
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+STDLIB = {"math", "time", "json"}
+
+
+def script_path(name):
+    """"raspy/gustav3.py" -> absolute path inside the repo."""
+    return os.path.join(REPO_DIR, name)
+
+
+def _imports_ok(node):
+    if isinstance(node, ast.Import):
+        return all(alias.name in STDLIB for alias in node.names)
+    return node.module in STDLIB
+
+
+def _value_ok(value, known, pure):
+    for node in ast.walk(value):
+        if isinstance(node, ast.Name) and node.id not in known:
+            return False
+        if isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name) and func.id in pure:
+                continue
+            if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) \
+                    and func.value.id == "math":
+                continue
+            return False
+    return True
+
+
+def load(name, pure=()):
+    """Module object with the hardware-free parts of a sensor script."""
+    path = script_path(name)
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+
+    module = types.ModuleType(os.path.splitext(os.path.basename(path))[0])
+    module.__file__ = path
+    namespace = module.__dict__
+    known = set(dir(__builtins__)) if isinstance(__builtins__, types.ModuleType) else set(__builtins__)
+
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if not _imports_ok(node):
+                continue
+        elif isinstance(node, ast.Assign):
+            if not _value_ok(node.value, known, pure):
+                continue
+        elif not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        code = compile(ast.Module(body=[node], type_ignores=[]), path, "exec")
+        exec(code, namespace)
+        known.update(k for k in namespace if not k.startswith("__"))
+    return module
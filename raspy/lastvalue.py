@@ -0,0 +1,69 @@
+import math
+import time
+
+from stability import STABILITY_ROOM, STABILITY_TIME
+
+# ----------------------------
+# Last-value cache
+# ----------------------------
+# Keeps the newest position and dwell state of every device, so a consumer
+# that connects or subscribes gets the current picture straight away
+# instead of waiting for the next sensor message.
+#
+# Devices that have not sent anything for LAST_VALUE_TTL seconds are
+# dropped, so a globe that was switched off doesn't linger in snapshots.
+
+LAST_VALUE_TTL = 60  # seconds
+
+
+class LastValueCache:
+    def __init__(self, room=STABILITY_ROOM, stable_time=STABILITY_TIME, ttl=LAST_VALUE_TTL):
+        self.room = room
+        self.stable_time = stable_time
+        self.ttl = ttl
+        self.devices = {}  # device -> state dict
+
+    def update(self, device, group, lat, lon, now=None):
+        now = time.time() if now is None else now
+        state = self.devices.get(device)
+        if state is None:
+            state = self.devices[device] = {"anchor": (lat, lon), "stable_since": now}
+        elif not (math.isclose(lat, state["anchor"][0], abs_tol=self.room)
+                  and math.isclose(lon, state["anchor"][1], abs_tol=self.room)):
+            # moved, dwell starts over from here
+            state["anchor"] = (lat, lon)
+            state["stable_since"] = now
+        state["group"] = group
+        state["lat"] = lat
+        state["lon"] = lon
+        state["updated"] = now
+
+    def forget(self, device):
+        self.devices.pop(device, None)
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        for device in [d for d, state in self.devices.items() if now - state["updated"] > self.ttl]:
+            del self.devices[device]
+
+    def snapshot(self, subscription=None, now=None):
+        """One message per device the subscription covers, same shape as a preview."""
+        now = time.time() if now is None else now
+        self.expire(now)
+        messages = []
+        for device, state in self.devices.items():
+            # a snapshot doesn't use up the "previews" rate slot
+            if subscription is not None and not (subscription.matches(device, state["group"])
+                                                 and subscription.wants(False)):
+                continue
+            stable_for = now - state["stable_since"]
+            messages.append({
+                "lat": state["lat"],
+                "long": state["lon"],
+                "device": device,
+                "snapshot": True,
+                "stable": stable_for >= self.stable_time,
+                "stable_for": round(stable_for, 3),
+                "age": round(now - state["updated"], 3),
+            })
+        return messages
@@ -0,0 +1,485 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import time
+
+import kernels
+from bench_math import git_commit, summary, time_batch
+
+# ----------------------------
+# Lat/lon accuracy check
+# ----------------------------
+# Feeds every sensor script's lat/lon math with orientations made for known
+# globe points and measures how far off the answer is, next to what it
+# costs per sample.
+#
+#   python latlon_check.py                       (summary per script)
+#   python latlon_check.py --points              (error at every named point)
+#   python latlon_check.py --json check.json
+#   python latlon_check.py --compare check.json  (exit 1 if a script got worse)
+#
+# The ground truth is a model of how the globe is read, and the scripts
+# don't agree on one, so there are two:
+#   pointer  the device points along its axis (the script's sensor_axis or
+#            "up" vector) at a globe fixed in the room
+#   facing   the sensor sits in the globe and the point facing up is read
+# For each point the orientation is built with this file's own quaternion
+# math, at several roll angles about the reading direction (the point read
+# must not depend on them), and the accelerometer gets the gravity vector
+# that orientation would measure.
+#
+# The scripts run with their start-up calibration. How the sensor is
+# mounted, and which world axis a script calls north, is a fixed rotation
+# that calibration would take out, so for every script and model one is
+# fitted from the answers at CAL_POINTS (like a two-point calibration).
+# What's left is the script's own error: mirrored longitudes, mixed frames,
+# pole and antimeridian handling, roll dependence.
+#
+# Error is the great-circle angle between the answer and the point, in
+# degrees. A script that raises or returns None counts as failed there.
+
+SCRIPTS = {
+    # script: (path, functions whose results may be used in constants)
+    "gustav": ("raspy/gustav.py", ()),
+    "gustav2": ("raspy/gustav2.py", ()),
+    "gustav3": ("raspy/gustav3.py", ()),
+    "testx": ("raspy/testx.py", ()),
+    "testy": ("raspy/testy.py", ()),
+    "manual": ("raspy/manual.py", ()),
+    "magnetic": ("raspy/magnetic.py", ()),
+    "magnetic2": ("raspy/magnetic2.py", ()),
+    "globe_offset": ("raspy/globe_offset.py", ()),
+    "globe_offset2": ("raspy/globe_offset2.py", ()),
+    "globe_two_pt": ("raspy/globe_two_pt.py", ()),
+    "test": ("raspPi/test.py", ()),
+    "gyrotest": ("raspPi/gyrotest.py", ()),
+    "megatest": ("raspPi/megatest.py", ("quat_from_axis_angle",)),
+    "globe": ("raspPi/globe.py", ("quat_from_axis_angle",)),
+}
+
+# what listentest.py is fed from
+PRODUCTION = "globe"
+
+MODELS = ("pointer", "facing")
+
+POINTS = {
+    "Null Island": (0.0, 0.0),
+    "North Pole": (90.0, 0.0),
+    "South Pole": (-90.0, 0.0),
+    "near North Pole": (89.9, 45.0),
+    "near South Pole": (-89.9, -135.0),
+    "antimeridian": (0.0, 180.0),
+    "antimeridian east": (0.0, 179.9),
+    "antimeridian west": (0.0, -179.9),
+    "Fiji": (-17.7, 178.0),
+    "Oslo": (59.91, 10.75),
+    "Sydney": (-33.87, 151.21),
+    "Honolulu": (21.31, -157.86),
+    "Quito": (-0.18, -78.47),
+}
+CAL_POINTS = ((20.0, 30.0), (-10.0, 110.0))
+ROLLS = (0.0, 45.0, 135.0, 270.0)  # degrees about the reading direction
+RANDOM_POINTS = 200                # uniform over the globe, each at a random roll
+
+GRAVITY = 9.81
+IDENTITY = (0.0, 0.0, 0.0, 1.0)
+UP = (0.0, 0.0, 1.0)
+
+REPEAT = 5
+
+
+# ----------------------------
+# Reference math, (x, y, z, w) quaternions
+# ----------------------------
+def qmul(a, b):
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    return (aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+            aw * bw - ax * bx - ay * by - az * bz)
+
+
+def qconj(q):
+    return (-q[0], -q[1], -q[2], q[3])
+
+
+def rotate(q, v):
+    return qmul(qmul(q, (v[0], v[1], v[2], 0.0)), qconj(q))[:3]
+
+
+def axis_angle(axis, deg):
+    s = math.sin(math.radians(deg) / 2)
+    return (axis[0] * s, axis[1] * s, axis[2] * s, math.cos(math.radians(deg) / 2))
+
+
+def cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+
+def dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def unit(v):
+    n = math.sqrt(dot(v, v))
+    return (v[0] / n, v[1] / n, v[2] / n)
+
+
+def between(a, b):
+    """Shortest rotation taking unit vector a to unit vector b."""
+    d = dot(a, b)
+    if d < -1 + 1e-12:
+        # opposite, any axis perpendicular to a will do
+        axis = cross(a, (1.0, 0.0, 0.0))
+        if dot(axis, axis) < 1e-12:
+            axis = cross(a, (0.0, 1.0, 0.0))
+        return axis_angle(unit(axis), 180.0)
+    c = cross(a, b)
+    return unit4((c[0], c[1], c[2], 1 + d))
+
+
+def unit4(q):
+    n = math.sqrt(q[0] * q[0] + q[1] * q[1] + q[2] * q[2] + q[3] * q[3])
+    return (q[0] / n, q[1] / n, q[2] / n, q[3] / n)
+
+
+def latlon_to_vec(lat, lon):
+    """+Z north pole, +X Null Island, +Y 90°E."""
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+def angle_between(a, b):
+    c = cross(a, b)
+    return math.degrees(math.atan2(math.sqrt(dot(c, c)), dot(a, b)))
+
+
+# ----------------------------
+# Ground truth
+# ----------------------------
+def pose(model, axis, lat, lon, roll):
+    """Sensor quaternion and accelerometer reading with (lat, lon) being read."""
+    target = latlon_to_vec(lat, lon)
+    if model == "pointer":
+        # axis turned onto the point, then rolled about it
+        q = qmul(axis_angle(target, roll), between(axis, target))
+    else:
+        # the point turned to face up, then the globe spun about the vertical
+        q = qmul(axis_angle(UP, roll), between(target, UP))
+    accel = tuple(GRAVITY * c for c in rotate(qconj(q), UP))
+    return q, accel
+
+
+def perturb(rng, q, degrees):
+    """q turned by up to `degrees` about a random axis, as sensor noise."""
+    axis = unit((rng.gauss(0, 1), rng.gauss(0, 1), rng.gauss(0, 1)))
+    return qmul(axis_angle(axis, rng.uniform(0, degrees)), q)
+
+
+def samples(rng):
+    """[(name, lat, lon, roll)] for the named points and RANDOM_POINTS more."""
+    cases = [(name, lat, lon, roll) for name, (lat, lon) in POINTS.items() for roll in ROLLS]
+    for i in range(RANDOM_POINTS):
+        lat = math.degrees(math.asin(rng.uniform(-1, 1)))
+        cases.append((f"random {i}", lat, rng.uniform(-180, 180), rng.uniform(0, 360)))
+    return cases
+
+
+# ----------------------------
+# The scripts' main-loop math
+# ----------------------------
+def _quiet(fn, *args):
+    # the calibrate() functions print a banner
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(*args)
+
+
+def _pointing(m):
+    """Axis the script reads the globe along, in the sensor frame."""
+    if hasattr(m, "sensor_axis"):
+        return m.sensor_axis
+    if hasattr(m, "TILT_QUAT"):
+        # up, tilted by SENSOR_TILT_DEG as the mount is
+        return rotate(m.TILT_QUAT, m.UP_VEC)
+    return m.sensor_up
+
+
+def _startup(m):
+    # testx and the like calibrate on start; with the sensor at rest in the
+    # reference pose that is the identity
+    if getattr(m, "calibration_quat", IDENTITY) is None:
+        _quiet(m.calibrate, IDENTITY)
+
+
+def _two_point(m, model):
+    # globe_two_pt.calibrate_point(): North Pole, then Null Island
+    axis = unit(m.sensor_axis)
+    north = m.normalize(m.rotate_vector_by_quat(m.sensor_axis, pose(model, axis, 90.0, 0.0, 0.0)[0]))
+    m.north_unit = north
+    world_vec = m.normalize(m.rotate_vector_by_quat(m.sensor_axis, pose(model, axis, 0.0, 0.0, 0.0)[0]))
+    proj = m.sub(world_vec, m.scale(north, m.dot(world_vec, north)))
+    m.east_unit = m.ref_axis = m.normalize(proj)
+
+
+def pipelines(m):
+    """function(q, accel) -> (lat, lon) as the script's main loop computes it."""
+    name = m.__name__
+
+    if name in ("gustav", "gyrotest", "globe_offset", "globe_offset2"):
+        def run(q, accel):
+            corrected_q = m.quat_mul(m.calibration_quat, q)
+            if name == "gustav":
+                corrected_q = m.quat_norm(corrected_q)
+            return m.vector_to_latlon(m.rotate_vector_by_quat(m.sensor_axis, corrected_q))
+
+    elif name == "gustav2":
+        def run(q, accel):
+            corrected_q = m.quat_norm(m.quat_mul(m.calibration_quat, q))
+            world_vec_imu = m.rotate_vector_by_quat(m.sensor_axis, corrected_q)
+            return m.vector_to_latlon(m.imu_vec_to_globe_vec(world_vec_imu))
+
+    elif name == "gustav3":
+        def run(q, accel):
+            world_vec = m.rotate_vector_by_quat(m.sensor_axis, m.quat_norm(q))
+            world_vec = m.rotate_vector_by_quat(world_vec, m.calibration_quat)
+            return m.vector_to_latlon(world_vec)
+
+    elif name == "test":
+        def run(q, accel):
+            corrected_q = m.quat_mul(m.calibration_quat, q)
+            world_vec = m.rotate_z_90_left(m.rotate_vector_by_quat(m.sensor_axis, corrected_q))
+            return m.vector_to_latlon(world_vec)
+
+    elif name == "globe_two_pt":
+        def run(q, accel):
+            return m.vector_to_latlon_2point(m.rotate_vector_by_quat(m.sensor_axis, q))
+
+    elif name in ("testx", "testy", "manual"):
+        def run(q, accel):
+            corrected_q = m.quat_norm(m.quat_mul(m.calibration_quat, m.quat_norm(q)))
+            world_forward = m.rotate_vector_by_quat(m.sensor_forward, corrected_q)
+            world_up = m.normalize(accel)
+            if name == "manual":
+                # CONTINENT_TO_DISPLAY in manual.main_loop
+                return m.vector_to_latlon(world_forward, world_up, continent="USA")
+            return m.vector_to_latlon(world_forward, world_up)
+
+    elif name in ("magnetic", "magnetic2"):
+        def run(q, accel):
+            quat = m.quat_norm(q)
+            if name == "magnetic":
+                quat = m.quat_norm(m.quat_mul(m.calibration_quat, quat))
+            world_forward = m.rotate_vector_by_quat(m.sensor_forward, quat)
+            world_up = m.rotate_vector_by_quat(m.sensor_up, quat)
+            return m.vector_to_latlon(world_forward, world_up)
+
+    elif name in ("globe", "megatest"):
+        def run(q, accel):
+            corrected_q = m.quat_mul(m.calibration_quat, q)
+            up_tilted = m.rotate_vector(m.TILT_QUAT, m.UP_VEC)
+            forward_tilted = m.rotate_vector(m.TILT_QUAT, m.FORWARD_VEC)
+            up_world = m.rotate_vector(corrected_q, up_tilted)
+            forward_world = m.rotate_vector(corrected_q, forward_tilted)
+            return m.vectors_to_lat_lon(up_world, forward_world)
+
+    else:
+        raise KeyError(f"no pipeline for {name}")
+    return run
+
+
+# ----------------------------
+# Frame fit and scoring
+# ----------------------------
+def answer_vec(result):
+    lat, lon = result
+    if lat is None or lon is None:
+        return None
+    return latlon_to_vec(lat, lon)
+
+
+def fit_frame(answers, truths):
+    """Rotation matrix taking the two answers onto the two truths (TRIAD), or None."""
+    def triad(a, b):
+        c = cross(a, b)
+        if dot(c, c) < 1e-12:
+            return None
+        c = unit(c)
+        return (a, c, cross(a, c))
+
+    u = triad(*answers)
+    t = triad(*truths)
+    if u is None or t is None:
+        return None
+    # C = T * U^T
+    return [[sum(t[k][i] * u[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+
+
+def apply(matrix, v):
+    return tuple(dot(row, v) for row in matrix)
+
+
+def evaluate(fn, model, axis, cases, rng, noise):
+    """Per-case error in degrees (None when it failed) and the inputs that worked."""
+    def call(lat, lon, roll):
+        q, accel = pose(model, axis, lat, lon, roll)
+        if noise:
+            q = perturb(rng, q, noise)
+            accel = tuple(GRAVITY * c for c in rotate(qconj(q), UP))
+        try:
+            return answer_vec(fn(q, accel)), (q, accel)
+        except (ValueError, TypeError, ZeroDivisionError):
+            return None, (q, accel)
+
+    answers = [call(lat, lon, 0.0)[0] for lat, lon in CAL_POINTS]
+    frame = None if None in answers else fit_frame(answers, [latlon_to_vec(*p) for p in CAL_POINTS])
+
+    errors, inputs = [], []
+    for name, lat, lon, roll in cases:
+        got, args = call(lat, lon, roll)
+        if got is not None:
+            inputs.append(args)
+        if got is None or frame is None:
+            errors.append((name, None))
+            continue
+        errors.append((name, angle_between(apply(frame, got), latlon_to_vec(lat, lon))))
+    return errors, inputs
+
+
+def score(errors):
+    ok = sorted(e for _, e in errors if e is not None)
+    failed = len(errors) - len(ok)
+    # worst over the rolls, None if any of them failed
+    worst = {}
+    for name, e in errors:
+        if name in POINTS and worst.get(name, 0) is not None:
+            worst[name] = None if e is None else max(e, worst.get(name, 0))
+    if not ok:
+        return {"median": None, "p95": None, "max": None, "failed": failed, "points": worst}
+    return {
+        "median": round(ok[len(ok) // 2], 4),
+        "p95": round(ok[min(len(ok) - 1, int(round(0.95 * (len(ok) - 1))))], 4),
+        "max": round(ok[-1], 4),
+        "failed": failed,
+        "points": {k: None if v is None else round(v, 4) for k, v in worst.items()},
+    }
+
+
+def _rank(s):
+    # fewest failures, then the smallest typical error
+    return (s["failed"], s["p95"] if s["p95"] is not None else math.inf)
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    cases = samples(rng)
+    results = {}
+    for script, (path, pure) in SCRIPTS.items():
+        if args.only and not any(part in script for part in args.only):
+            continue
+        m = kernels.load(path, pure)
+        _startup(m)
+        fn = pipelines(m)
+        axis = unit(_pointing(m))
+
+        models, inputs = {}, []
+        for model in MODELS:
+            if script == "globe_two_pt":
+                _two_point(m, model)
+            errors, ok_inputs = evaluate(fn, model, axis, cases, random.Random(f"{args.seed}:{script}"),
+                                         args.noise)
+            models[model] = score(errors)
+            inputs = inputs or ok_inputs
+        best = min(MODELS, key=lambda model: _rank(models[model]))
+        cost = summary(time_batch(fn, inputs, args.repeat)) if inputs else None
+        results[script] = {"best": best, "models": models, "ns_per_sample": cost}
+    return results
+
+
+# ----------------------------
+# Output
+# ----------------------------
+def _deg(v):
+    return "-" if v is None else f"{v:.3f}"
+
+
+def print_results(results, points):
+    print(f"{'script':15s} {'model':8s} {'median°':>9s} {'p95°':>9s} {'max°':>9s} {'failed':>7s} {'ns/sample':>10s}")
+    for script, r in results.items():
+        s = r["models"][r["best"]]
+        mark = " *" if script == PRODUCTION else ""
+        cost = "-" if r["ns_per_sample"] is None else f"{r['ns_per_sample']['median']:.0f}"
+        print(f"{script + mark:15s} {r['best']:8s} {_deg(s['median']):>9s} {_deg(s['p95']):>9s} "
+              f"{_deg(s['max']):>9s} {s['failed']:7d} {cost:>10s}")
+        if points:
+            for name, e in s["points"].items():
+                print(f"    {name:22s} {_deg(e):>9s}")
+    print(f"\n* production ({PRODUCTION}); model is the reading that fits the script best, "
+          f"error after the two-point frame fit, worst over {len(ROLLS)} rolls for named points")
+
+
+def compare(results, path, tolerance):
+    """Print what got worse than an earlier run; True if anything did."""
+    with open(path, encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\nAgainst {path} ({old['meta'].get('commit')}):")
+    worse = False
+    for script, r in results.items():
+        before = old["results"].get(script)
+        if before is None:
+            print(f"{script:15s} new")
+            continue
+        now_s, old_s = r["models"][before["best"]], before["models"][before["best"]]
+        notes = []
+        if now_s["failed"] > old_s["failed"]:
+            notes.append(f"failed {old_s['failed']} -> {now_s['failed']}")
+        for key in ("p95", "max"):
+            a, b = old_s[key], now_s[key]
+            if a is not None and (b is None or b > a + tolerance):
+                notes.append(f"{key} {_deg(a)}° -> {_deg(b)}°")
+        if notes:
+            worse = True
+        cost_note = ""
+        if r["ns_per_sample"] and before.get("ns_per_sample"):
+            ratio = r["ns_per_sample"]["median"] / before["ns_per_sample"]["median"]
+            cost_note = f"  {ratio:.2f}x time"
+        print(f"{script:15s} {'; '.join(notes) or 'ok'}{cost_note}")
+    return worse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Accuracy and cost of every lat/lon conversion")
+    parser.add_argument("--points", action="store_true", help="show the error at every named point")
+    parser.add_argument("--noise", type=float, default=0.0, help="random sensor error, degrees")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--only", nargs="*", help="check scripts whose name contains one of these")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="degrees of extra error allowed")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    started = time.time()
+    results = run(args)
+    print_results(results, args.points)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "commit": git_commit(),
+                    "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "seed": args.seed,
+                    "noise": args.noise,
+                    "seconds": round(time.time() - started, 1),
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"Wrote {args.json}")
+    if args.compare and compare(results, args.compare, args.tolerance):
+        raise SystemExit(1)
@@ -1,39 +1,180 @@
 import asyncio
 import websockets
 import json
+import time
+
+from fanout import DROP_OLDEST, QUEUE_SIZE, Subscriber, broadcast
+from lastvalue import LastValueCache
+from topics import TopicRouter, parse_subscribe
+# symlinks to the raspPi modules, one copy of the code for both relays
+from relay_metrics import Metrics, RateMeter, serve_metrics
+from relay_workers import run_workers
 
 HOST = "0.0.0.0"
 PORT = 8765
 
-connected_sensors = set()  # store clients if you want to broadcast
+# number of relay processes sharing PORT via SO_REUSEPORT, see relay_workers.py.
+# 1 keeps the plain single-process relay.
+WORKERS = 1
+worker = None  # WorkerContext when running as one of several workers
+
+# per-client send queue, see fanout.py
+SUBSCRIBER_QUEUE_SIZE = QUEUE_SIZE
+SLOW_CONSUMER_POLICY = DROP_OLDEST  # or DISCONNECT
+
+# device id -> group, for senders that don't say their group themselves
+DEVICE_GROUPS = {}
+
+# plain-text metrics on a side port, see relay_metrics.py
+# (each worker listens on METRICS_PORT + its index)
+METRICS_ENABLED = True
+METRICS_PORT = 9100
+VERBOSE = False  # print every message; slow at high rates
+
+subscribers = {}  # websocket -> Subscriber
+router = TopicRouter()  # who wants which devices, see topics.py
+connection_devices = {}  # websocket -> devices seen on that connection
+last_values = LastValueCache()  # sent to consumers as soon as they (re)subscribe
+
+metrics = Metrics()
+message_rates = RateMeter()
+metrics.describe("messages_total", "Sensor messages received, by device")
+metrics.describe("decode_errors_total", "Messages that were not valid JSON")
+metrics.describe("fanout_seconds", "Routing, serialising and queueing one message")
+metrics.describe("delivery_seconds", "Time from queueing to send done, per subscriber")
+metrics.gauge("device_messages_per_second", lambda: {
+    (("device", device),): rate for device, rate in message_rates.rates().items()
+})
+metrics.gauge("connections", lambda: len(subscribers))
+metrics.gauge("active_devices", lambda: len(set().union(*connection_devices.values())))
+metrics.gauge("queue_depth_total", lambda: sum(len(sub.queue) for sub in subscribers.values()))
+metrics.gauge("queue_depth_max", lambda: max((len(sub.queue) for sub in subscribers.values()), default=0))
+metrics.gauge("subscriber_dropped", lambda: sum(sub.dropped for sub in subscribers.values()))
+
+def observe_delivery(seconds):
+    metrics.observe("delivery_seconds", seconds)
+
+def remember(device, group, is_event, message):
+    if is_event:
+        if message.get("type") == "calibration":
+            # old coordinates belong to the old reference frame
+            last_values.forget(device)
+    else:
+        last_values.update(device, group, message["lat"], message["long"])
+
+def send_snapshot(websocket):
+    """Current state of every device this connection is subscribed to."""
+    sub = subscribers[websocket]
+    for message in last_values.snapshot(router.subs.get(sub)):
+        sub.push(json.dumps(message))
+
+def route(device, group, is_event, message, skip=None):
+    """Send a message to the subscribers interested in this device."""
+    started = time.perf_counter()
+    remember(device, group, is_event, message)
+    recipients = router.recipients(device, group, is_event)
+    if not recipients and worker is None:
+        return
+    # serialised once, each client's writer task does the send
+    payload = json.dumps(message)
+    broadcast(recipients, payload, skip=skip)
+    if worker is not None:
+        worker.publish(("route", device, group, is_event, payload, message))
+    metrics.observe("fanout_seconds", time.perf_counter() - started)
+
+def handle_inbox(item):
+    """A message another worker received; fan it out to our own clients."""
+    kind = item[0]
+    if kind == "route":
+        _, device, group, is_event, payload, message = item
+        remember(device, group, is_event, message)
+        broadcast(router.recipients(device, group, is_event), payload)
+
+async def handle_subscribe(websocket, data):
+    try:
+        options = parse_subscribe(data)
+    except ValueError as e:
+        await websocket.send(json.dumps({"type": "error", "error": str(e)}))
+        return
+    router.subscribe(subscribers[websocket], **options)
+    await websocket.send(json.dumps({"type": "subscribed", **options}))
+    send_snapshot(websocket)
 
 async def handle_sensor(websocket):  # <-- MUST include 'path'
     print(f"Sensor connected: {websocket.remote_address}")
-    connected_sensors.add(websocket)
+    subscribers[websocket] = Subscriber(websocket, SUBSCRIBER_QUEUE_SIZE, SLOW_CONSUMER_POLICY, observe_delivery)
+    # everything until the client subscribes to something narrower
+    router.subscribe(subscribers[websocket])
+    send_snapshot(websocket)
+    address = websocket.remote_address
+    devices = connection_devices[websocket] = set()
     try:
         async for message in websocket:
+            received_at = time.time()
             try:
                 data = json.loads(message)
+                if data.get("type") == "subscribe":
+                    await handle_subscribe(websocket, data)
+                    continue
+                if data.get("type") == "clock_sync":
+                    # answer the Pi's ping like listentest.py does, it isn't an event to forward
+                    await websocket.send(json.dumps({
+                        "type": "clock_sync",
+                        "t0": data.get("t0"),
+                        "t1": received_at,
+                        "t2": time.time(),
+                    }))
+                    continue
+
+                # senders without a device id are told apart by address
+                device = data.get("device") or f"{address[0]}:{address[1]}"
+                group = data.get("group") or DEVICE_GROUPS.get(device)
+                devices.add(device)
+                # label by DEVICE_ID only: ip:port changes on every reconnect
+                label = data.get("device") or "unknown"
+                metrics.inc("messages_total", device=label)
+                message_rates.mark(label)
+
+                if data.get("type"):
+                    # discrete event (calibration, stable, ...), forwarded as is
+                    if VERBOSE:
+                        print(f"Event from {device}: {data['type']}")
+                    route(device, group, True, {**data, "device": device}, skip=websocket)
+                    continue
+
                 lat = data.get("lat")
                 lon = data.get("lon")
                 if lat is not None and lon is not None:
-                    print(f"Received from sensor: lat={lat}, lon={lon}")
+                    if VERBOSE:
+                        print(f"Received from sensor: lat={lat}, lon={lon}")
 
-                    # Broadcast to all connected clients (Node-RED or frontend)
-                    for ws in connected_sensors:
-                        if ws != websocket:  # optional: skip sender
-                            await ws.send(json.dumps({"lat": lat, "long": lon}))
+                    # Send to interested clients (Node-RED or frontend)
+                    route(device, group, False, {"lat": lat, "long": lon, "device": device}, skip=websocket)  # optional: skip sender
             except json.JSONDecodeError:
-                print("Invalid JSON:", message)
+                metrics.inc("decode_errors_total")
+                if VERBOSE:
+                    print("Invalid JSON:", message)
     except websockets.ConnectionClosed:
         print(f"Sensor disconnected: {websocket.remote_address}")
     finally:
-        connected_sensors.remove(websocket)
+        router.unsubscribe(subscribers[websocket])
+        subscribers.pop(websocket).close()
+        connection_devices.pop(websocket, None)
+
+async def main(ctx=None):
+    global worker
+    worker = ctx
+    if ctx is not None:
+        ctx.start_inbox(handle_inbox)
+    if METRICS_ENABLED:
+        await serve_metrics(metrics, HOST, METRICS_PORT + (ctx.index if ctx else 0))
 
-async def main():
-    async with websockets.serve(handle_sensor, HOST, PORT):
+    async with websockets.serve(handle_sensor, HOST, PORT, reuse_port=ctx is not None):
         print(f"WebSocket server running on ws://{HOST}:{PORT}")
         await asyncio.Future()  # run forever
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1:
+        run_workers(main, WORKERS)
+    else:
+        asyncio.run(main())
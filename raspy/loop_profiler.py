@@ -0,0 +1 @@
+../raspPi/loop_profiler.py
\ No newline at end of file
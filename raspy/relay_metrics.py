@@ -0,0 +1 @@
+../raspPi/relay_metrics.py
\ No newline at end of file
@@ -0,0 +1 @@
+../raspPi/relay_workers.py
\ No newline at end of file
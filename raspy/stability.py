@@ -0,0 +1 @@
+../raspPi/stability.py
\ No newline at end of file
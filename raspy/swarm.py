@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+import time
+
+import websockets
+
+# symlinks to the raspPi modules, one copy of the code for both relays
+from tracing import Histogram, mark, new_trace
+from udp_transport import UdpCoordSender
+
+# ----------------------------
+# Synthetic sensor swarm
+# ----------------------------
+# Load generator for listentest.py / listentest2.py without physical Pis.
+# Every fake globe wanders to a random point, slows down, dwells there
+# long enough to trigger the stability check, then moves on.
+#
+#   python swarm.py --sensors 500 --rate 10 --subscribers 20 --duration 60
+#
+# Subscribers only get something back from listentest2.py. Latency is
+# measured from the fake globe's send to the subscriber's receive, matched
+# on (device, lat, lon), so both sides must run on this machine.
+
+WS_URI = "ws://127.0.0.1:8765"
+UDP_HOST = "127.0.0.1"
+UDP_PORT = 8766
+
+FORMATS = ("plain", "traced", "udp")
+
+# movement model
+MOVE_SPEED = 40.0      # degrees per second while moving
+DWELL_TIME = (3, 8)    # seconds spent still over a point
+DWELL_JITTER = 0.5     # degrees of noise while dwelling, below stability_room
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.send_errors = 0
+        self.connected = 0
+        self.connect_errors = 0
+        self.disconnects = 0
+        self.received = 0
+        self.matched = 0
+        self.latency = Histogram()
+        self.sent_at = {}  # (device, lat, lon) -> send time, for latency matching
+
+    def snapshot(self, elapsed):
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "sensors_connected": self.connected,
+            "sent": self.sent,
+            "sent_per_s": round(self.sent / elapsed, 1) if elapsed else 0.0,
+            "send_errors": self.send_errors,
+            "connect_errors": self.connect_errors,
+            "disconnects": self.disconnects,
+            "received": self.received,
+            "received_per_s": round(self.received / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {
+                "matched": self.matched,
+                "p50": _ms(self.latency.percentile(50)),
+                "p95": _ms(self.latency.percentile(95)),
+                "p99": _ms(self.latency.percentile(99)),
+            },
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class Wanderer:
+    """Position of one fake globe: move to a target, dwell, pick a new one."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.lat = rng.uniform(-60, 70)
+        self.lon = rng.uniform(-180, 180)
+        self._new_target()
+
+    def _new_target(self):
+        self.target = (self.rng.uniform(-60, 70), self.rng.uniform(-180, 180))
+        self.dwell_left = self.rng.uniform(*DWELL_TIME)
+
+    def step(self, dt):
+        tlat, tlon = self.target
+        dlat = tlat - self.lat
+        dlon = (tlon - self.lon + 180) % 360 - 180
+        dist = math.hypot(dlat, dlon)
+        if dist > DWELL_JITTER:
+            # ease in: slow down when close, like a hand settling on a country
+            move = min(dist, max(MOVE_SPEED * dt * min(1.0, dist / 20), DWELL_JITTER / 2))
+            self.lat += dlat / dist * move
+            self.lon = (self.lon + dlon / dist * move + 180) % 360 - 180
+        else:
+            self.dwell_left -= dt
+            if self.dwell_left <= 0:
+                self._new_target()
+        jitter = DWELL_JITTER / 2
+        return (
+            round(self.lat + self.rng.uniform(-jitter, jitter), 3),
+            round(self.lon + self.rng.uniform(-jitter, jitter), 3),
+        )
+
+
+async def drain(websocket):
+    """Read and drop whatever the relay sends a sensor, so its queue never fills."""
+    try:
+        async for _ in websocket:
+            pass
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def run_sensor(index, args, stats, stop):
+    device = f"swarm-{index}"
+    rng = random.Random(args.seed + index)
+    walker = Wanderer(rng)
+    interval = 1.0 / args.rate
+    udp = UdpCoordSender(args.udp_host, args.udp_port, device) if args.format == "udp" else None
+
+    # spread connects over the ramp so the relay doesn't see one burst
+    await asyncio.sleep(args.ramp * index / max(1, args.sensors))
+    try:
+        async with websockets.connect(args.uri, open_timeout=10) as websocket:
+            stats.connected += 1
+            # listentest2 subscribes every connection to everything; a globe
+            # only needs its own events, which the relay never echoes back
+            await websocket.send(json.dumps({"type": "subscribe", "devices": [device], "mode": "events"}))
+            reader = asyncio.create_task(drain(websocket))
+            next_at = time.monotonic()
+            while not stop.is_set():
+                lat, lon = walker.step(interval)
+                msg = {"device": device, "lat": lat, "lon": lon}
+                if args.format == "traced":
+                    trace = new_trace()
+                    for hop in ("imu_start", "imu_read", "latlon", "sent"):
+                        mark(trace, hop)
+                    trace["clock_offset"] = 0.0
+                    msg["trace"] = trace
+                stats.sent_at[(device, lat, lon)] = time.monotonic()
+                try:
+                    if udp:
+                        udp.send(lat, lon)
+                    else:
+                        await websocket.send(json.dumps(msg))
+                    stats.sent += 1
+                except websockets.ConnectionClosed:
+                    stats.disconnects += 1
+                    break
+                except OSError:
+                    stats.send_errors += 1
+
+                # fixed rate, without drift from the time spent sending
+                next_at += interval
+                await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+            reader.cancel()
+    except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+        stats.connect_errors += 1
+        if stats.connect_errors <= 5:
+            print(f"{device}: connect failed: {e}")
+    finally:
+        if udp:
+            udp.close()
+
+
+async def run_subscriber(index, args, stats, stop):
+    try:
+        async with websockets.connect(args.uri, open_timeout=10) as websocket:
+            if args.subscribe:
+                await websocket.send(json.dumps({"type": "subscribe", **json.loads(args.subscribe)}))
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                now = time.monotonic()
+                stats.received += 1
+                data = json.loads(message)
+                key = (data.get("device"), data.get("lat"), data.get("long"))
+                sent = stats.sent_at.get(key)
+                if sent is not None:
+                    stats.matched += 1
+                    stats.latency.observe(now - sent)
+    except websockets.ConnectionClosed:
+        stats.disconnects += 1
+    except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+        stats.connect_errors += 1
+        print(f"subscriber {index}: connect failed: {e}")
+
+
+async def report(stats, started, every, stop):
+    while not stop.is_set():
+        await asyncio.sleep(every)
+        # forget old send times so the matching table doesn't grow forever
+        if len(stats.sent_at) > 200000:
+            stats.sent_at.clear()
+        print(json.dumps(stats.snapshot(time.monotonic() - started)))
+
+
+def scrape_metrics(url):
+    host, _, rest = url.partition("//")[2].partition(":")
+    port, _, path = rest.partition("/")
+    with socket.create_connection((host, int(port)), timeout=5) as sock:
+        sock.sendall(f"GET /{path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    return data.partition(b"\r\n\r\n")[2].decode()
+
+
+async def main(args):
+    stats = Stats()
+    stop = asyncio.Event()
+    started = time.monotonic()
+
+    tasks = [asyncio.create_task(run_subscriber(i, args, stats, stop)) for i in range(args.subscribers)]
+    # subscribers first, so they see the sensors' first messages
+    await asyncio.sleep(0.5 if args.subscribers else 0)
+    tasks += [asyncio.create_task(run_sensor(i, args, stats, stop)) for i in range(args.sensors)]
+    reporter = asyncio.create_task(report(stats, started, args.report_every, stop))
+
+    await asyncio.sleep(args.duration)
+    stop.set()
+    # taken now, so connection teardown doesn't count against throughput
+    result = stats.snapshot(time.monotonic() - started)
+    reporter.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print("\nFinal:", json.dumps(result, indent=2))
+    if args.metrics_url:
+        try:
+            print("\nRelay metrics:\n" + scrape_metrics(args.metrics_url))
+        except OSError as e:
+            print("Could not read relay metrics:", e)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "result": result}, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthetic globe swarm for relay load tests")
+    parser.add_argument("--uri", default=WS_URI)
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=10.0, help="messages per second per sensor")
+    parser.add_argument("--format", choices=FORMATS, default="plain")
+    parser.add_argument("--udp-host", default=UDP_HOST)
+    parser.add_argument("--udp-port", type=int, default=UDP_PORT)
+    parser.add_argument("--subscribers", type=int, default=0)
+    parser.add_argument("--subscribe", help='subscribe options as JSON, e.g. \'{"mode": "previews", "rate": 2}\'')
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which sensors connect")
+    parser.add_argument("--report-every", type=float, default=5.0)
+    parser.add_argument("--metrics-url", help="e.g. http://127.0.0.1:9100/metrics, read at the end")
+    parser.add_argument("--json", help="write the final report to this file")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -13,6 +13,8 @@ from adafruit_bno08x import (
     BNO_REPORT_GYROSCOPE
 )
 
+from loop_profiler import LoopProfiler, serve_status
+
 # ----------------------------
 # RESET PIN
 # ----------------------------
@@ -141,6 +143,11 @@ sensor_forward = (1.0, 0.0, 0.0)  # Red arrow direction
 sensor_up      = (0.0, 0.0, 1.0)  # Blue arrow pointing top of globe
 calibration_quat = None            # Will auto-set on startup
 
+# 'p' prints per-stage timings of the main loop, see loop_profiler.py
+PROFILE_ENABLED = True
+PROFILE_STATUS_PORT = None  # e.g. 9101 to serve them over TCP as well
+profiler = LoopProfiler(enabled=PROFILE_ENABLED)
+
 # ----------------------------
 # Calibration
 # ----------------------------
@@ -166,16 +173,22 @@ def key_pressed():
 # ----------------------------
 def main_loop():
     global sensor, calibration_quat
-    print("Press 'c' to recalibrate 0° longitude\n")
+    print("Press 'c' to recalibrate 0° longitude, 'p' for loop timings\n")
+    if PROFILE_ENABLED and PROFILE_STATUS_PORT:
+        serve_status(profiler, port=PROFILE_STATUS_PORT)
 
     # Auto-set calibration on startup
     calibrate(sensor.quaternion)
 
     while True:
+        profiler.start()
         if key_pressed():
             ch = sys.stdin.read(1)
             if ch.lower() == "c":
                 calibrate(sensor.quaternion)
+            elif ch.lower() == "p":
+                print(profiler.report())
+        profiler.stage("keys")
 
         try:
             # Read sensor data
@@ -184,12 +197,14 @@ def main_loop():
                 print("Accel:", tuple(round(a,4) for a in accel))
             except:
                 print("Accel: N/A")
+            profiler.stage("accel_read")
 
             try:
                 gyro = sensor.gyro
                 print("Gyro:", tuple(round(g,4) for g in gyro))
             except:
                 print("Gyro: N/A")
+            profiler.stage("gyro_read")
 
             try:
                 quat = sensor.quaternion
@@ -198,6 +213,7 @@ def main_loop():
             except:
                 quat = (0,0,0,1)
                 print("Quat: N/A")
+            profiler.stage("quat_read")
 
             # Apply calibration
             corrected_q = quat_mul(calibration_quat, quat)
@@ -211,6 +227,7 @@ def main_loop():
 
             # Compute latitude and longitude
             lat, lon = vector_to_latlon(world_forward, world_up)
+            profiler.stage("math")
 
             # Print sensor info
             print("Corrected Quat:", tuple(round(c,4) for c in corrected_q))
@@ -221,8 +238,10 @@ def main_loop():
 
             # Detect special locations
             check_special_locations(lat, lon)
+            profiler.stage("print")
 
             time.sleep(0.1)
+            profiler.stage("sleep")
 
         except OSError:
             print("⚠️ I2C error — resetting sensor")
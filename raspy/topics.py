@@ -0,0 +1,123 @@
+import time
+
+# ----------------------------
+# Topic subscriptions
+# ----------------------------
+# A consumer narrows what it receives by sending
+#
+#   {"type": "subscribe",
+#    "devices": ["globe-1"],      # optional, device ids
+#    "groups": ["hall-a"],        # optional, device groups
+#    "mode": "all",               # "all" | "events" | "previews"
+#    "rate": 5}                   # previews per second per device, "previews" mode only
+#
+# No devices and no groups means every device. Connections that never
+# subscribe keep getting everything, like before.
+#
+# "events" are discrete messages (calibration, stable, ...), "previews"
+# are the continuous lat/lon samples.
+
+ALL = "all"
+EVENTS = "events"
+PREVIEWS = "previews"
+MODES = (ALL, EVENTS, PREVIEWS)
+
+
+class Subscription:
+    def __init__(self, subscriber, devices=(), groups=(), mode=ALL, rate=None):
+        self.subscriber = subscriber
+        self.devices = set(devices)
+        self.groups = set(groups)
+        self.mode = mode
+        self.min_interval = 1.0 / rate if rate else 0.0
+        self.last_preview = {}  # device -> time of the last preview let through
+
+    @property
+    def wildcard(self):
+        return not self.devices and not self.groups
+
+    def matches(self, device, group=None):
+        return self.wildcard or device in self.devices or (group is not None and group in self.groups)
+
+    def wants(self, is_event):
+        """Whether the mode takes this kind of message, before any rate limit."""
+        if self.mode == EVENTS:
+            return is_event
+        if self.mode == PREVIEWS:
+            return not is_event
+        return True
+
+    def accepts(self, device, is_event, now):
+        """wants(), plus the "previews" rate limit; now is time.monotonic()."""
+        if not self.wants(is_event):
+            return False
+        if self.mode == PREVIEWS and self.min_interval:
+            last = self.last_preview.get(device)
+            if last is not None and now - last < self.min_interval:
+                return False
+            self.last_preview[device] = now
+        return True
+
+
+def parse_subscribe(data):
+    """Validate a subscribe message; returns kwargs for Subscription or raises ValueError."""
+    mode = data.get("mode", ALL)
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}")
+    rate = data.get("rate")
+    if rate is not None and (not isinstance(rate, (int, float)) or rate <= 0):
+        raise ValueError("rate must be a positive number")
+    devices = data.get("devices") or []
+    groups = data.get("groups") or []
+    if not isinstance(devices, list) or not isinstance(groups, list):
+        raise ValueError("devices and groups must be lists")
+    return {"devices": devices, "groups": groups, "mode": mode, "rate": rate}
+
+
+class TopicRouter:
+    """Index of subscriptions by device and group, so routing a message
+    only looks at the subscribers that asked for it."""
+
+    def __init__(self):
+        self.subs = {}        # subscriber -> Subscription
+        self.wildcard = set()
+        self.by_device = {}   # device -> set of Subscription
+        self.by_group = {}    # group -> set of Subscription
+
+    def subscribe(self, subscriber, **kwargs):
+        self.unsubscribe(subscriber)
+        sub = Subscription(subscriber, **kwargs)
+        self.subs[subscriber] = sub
+        if sub.wildcard:
+            self.wildcard.add(sub)
+        for device in sub.devices:
+            self.by_device.setdefault(device, set()).add(sub)
+        for group in sub.groups:
+            self.by_group.setdefault(group, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, subscriber):
+        sub = self.subs.pop(subscriber, None)
+        if sub is None:
+            return
+        self.wildcard.discard(sub)
+        for device in sub.devices:
+            self._discard(self.by_device, device, sub)
+        for group in sub.groups:
+            self._discard(self.by_group, group, sub)
+
+    @staticmethod
+    def _discard(index, key, sub):
+        subs = index.get(key)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del index[key]
+
+    def recipients(self, device, group=None, is_event=False):
+        candidates = set(self.wildcard)
+        candidates.update(self.by_device.get(device, ()))
+        if group is not None:
+            candidates.update(self.by_group.get(group, ()))
+        now = time.monotonic()
+        return [sub.subscriber for sub in candidates if sub.accepts(device, is_event, now)]
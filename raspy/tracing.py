@@ -0,0 +1 @@
+../raspPi/tracing.py
\ No newline at end of file
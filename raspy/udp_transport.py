@@ -0,0 +1 @@
+../raspPi/udp_transport.py
\ No newline at end of file